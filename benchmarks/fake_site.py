@@ -0,0 +1,246 @@
+"""Local stand-in for the AnimeFenix site, used by the offline benchmarks.
+
+Serves search listings, anime pages, /ver/<slug>-<n>/descarga pages, redirect pages, mirror pages with a
+#downloadButton and large files, with configurable latency and per-connection bandwidth.
+"""
+import os
+import re
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+SEARCH_CARD = """
+<div class="group relative overflow-hidden rounded-lg bg-zinc-800">
+  <a href="{base}/{slug}"><img src="{base}/images/{slug}.jpg" alt="{title}"></a>
+  <div class="p-2">
+    <h3 class="text-sm font-semibold">{title}</h3>
+    <span class="bg-primary px-1 text-xs">{year}</span>
+    <span class="bg-zinc-700 px-1 text-xs">Finalizado</span>
+  </div>
+</div>"""
+
+EPISODE_ITEM = """<li class="py-2"><a href="{base}/ver/{slug}-{number}">Episodio {number}</a></li>"""
+
+DOWNLOAD_LINK = """<a class="bg-orange-500" href="{base}/redirect_download.php?server={server}&amp;file={slug}-{number}">{label}</a>"""
+
+PAGE = """<!DOCTYPE html>
+<html lang="es">
+<head><title>{title}</title>{filler}</head>
+<body>
+<nav class="flex overflow-hidden"><a href="/">AnimeFenix</a><a href="/animes">Animes</a></nav>
+<main>{body}</main>
+<footer class="text-zinc-500">{filler}</footer>
+</body>
+</html>"""
+
+GENRES = ["Acción", "Comedia", "Drama", "Fantasía", "Romance", "Shounen"]
+
+# Scripts and styles that make the pages roughly as heavy as the real ones
+FILLER = "<script>" + "var tracking = {'id': 1, 'events': []};" * 200 + "</script>"
+
+
+class FakeSiteConfig:
+    def __init__(self, anime_count=60, cards_per_page=24, episodes=24, file_size=64 * 1024 * 1024,
+                 bandwidth=0, latency=0.0, servers=("mediafire", "mega"), server_bandwidth=None, broken_servers=(),
+                 asset_delay=0.2):
+        """`bandwidth` is bytes per second per connection (0 = unlimited), `latency` seconds per request.
+
+        `server_bandwidth` overrides the bandwidth for some mirrors; `broken_servers` answer 404 for files.
+        `asset_delay` is how long each image, font, stylesheet and ad script on mirror pages takes to load,
+        which only browsers pay.
+        """
+        self.anime_count = anime_count
+        self.cards_per_page = cards_per_page
+        self.episodes = episodes
+        self.file_size = file_size
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.servers = servers
+        self.server_bandwidth = server_bandwidth or {}
+        self.broken_servers = broken_servers
+        self.asset_delay = asset_delay
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real site
+    site = None  # FakeSiteConfig, set by FakeSite
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def base(self):
+        return f"http://{self.headers.get('Host')}"
+
+    def do_GET(self):
+        if self.site.latency:
+            time.sleep(self.site.latency)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        path = url.path
+
+        if path == "/animes":
+            return self.send_html(self.search_page(query))
+        match = re.fullmatch(r"/ver/(.+)-(\d+)/descarga", path)
+        if match:
+            return self.send_html(self.download_page(match.group(1), int(match.group(2))))
+        if path == "/redirect_download.php":
+            # The real redirect pages bounce through a 302 to the mirror
+            target = f"{self.base}/mirror/{query['server'][0]}/{query['file'][0]}"
+            return self.send_redirect(target)
+        match = re.fullmatch(r"/mirror/(\w+)/(.+)", path)
+        if match:
+            return self.send_html(self.mirror_page(match.group(1), match.group(2)))
+        match = re.fullmatch(r"/(assets|ads)/(.+)", path)
+        if match:
+            return self.send_asset(match.group(2))
+        match = re.fullmatch(r"/files/(?:(\w+)/)?(.+)", path)
+        if match:
+            if match.group(1) in self.site.broken_servers:
+                return self.send_error(404)
+            return self.send_file(self.site.server_bandwidth.get(match.group(1), self.site.bandwidth))
+        if path == "/user/login":
+            return self.send_html(PAGE.format(title="Login", filler="", body="<form id='login'></form>"))
+        match = re.fullmatch(r"/([\w-]+)", path)
+        if match:
+            return self.send_html(self.anime_page(match.group(1)))
+        self.send_error(404)
+
+    def search_page(self, query):
+        page = int(query.get("page", ["1"])[0])
+        start = (page - 1) * self.site.cards_per_page
+        end = min(start + self.site.cards_per_page, self.site.anime_count)
+        cards = "".join(
+            SEARCH_CARD.format(base=self.base, slug=f"anime-{index}", title=f"Anime {index}", year=2000 + index % 25)
+            for index in range(start, end)
+        )
+        body = f'<div class="grid grid-cols-6 gap-4">{cards}</div>'
+        return PAGE.format(title="Animes", filler=FILLER, body=body)
+
+    def anime_page(self, slug):
+        items = "".join(EPISODE_ITEM.format(base=self.base, slug=slug, number=number)
+                        for number in range(1, self.site.episodes + 1))
+        genres = "".join(f'<a href="{self.base}/animes?genero[]={genre.lower()}">{genre}</a>'
+                         for genre in GENRES[hash(slug) % len(GENRES):][:2])
+        body = f'<h1>{slug}</h1><div class="flex gap-2">{genres}</div><ul class="divide-y divide-zinc-700">{items}</ul>'
+        return PAGE.format(title=slug, filler=FILLER, body=body)
+
+    def download_page(self, slug, number):
+        links = "".join(DOWNLOAD_LINK.format(base=self.base, server=server, slug=slug, number=number,
+                                             label=server.capitalize())
+                        for server in self.site.servers)
+        body = f'<div class="max-w-4xl mx-auto space-y-4">{links}</div>'
+        return PAGE.format(title=f"{slug} {number}", filler=FILLER, body=body)
+
+    def mirror_page(self, server, file_id):
+        # File hosts wrap the button in banners, web fonts and ad scripts, none of which the resolver needs
+        assets = ('<link rel="stylesheet" href="/assets/site.css">'
+                  + "".join(f'<img src="/assets/banner-{index}.jpg">' for index in range(6))
+                  + '<script src="/ads/tracker.js"></script>')
+        body = f'{assets}<a id="downloadButton" href="{self.base}/files/{server}/{file_id}.mp4">Download</a>'
+        return PAGE.format(title=file_id, filler=FILLER, body=body)
+
+    def send_html(self, html):
+        data = html.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_asset(self, name):
+        if self.site.asset_delay:
+            time.sleep(self.site.asset_delay)
+        types = {".css": "text/css", ".jpg": "image/jpeg", ".js": "application/javascript", ".woff2": "font/woff2"}
+        content_type = types.get(os.path.splitext(name)[1], "application/octet-stream")
+        if name == "site.css":
+            data = b"@font-face{font-family:f;src:url(/assets/font.woff2)} body{font-family:f}"
+        else:
+            data = b"\0" * (64 * 1024)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_file(self, bandwidth=0):
+        size = self.site.file_size
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header or "")
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", '"fake-site-file"')
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        chunk = b"\0" * (256 * 1024)
+        remaining = end - start + 1
+        started = time.monotonic()
+        sent = 0
+        try:
+            while remaining > 0:
+                data = chunk[:min(len(chunk), remaining)]
+                self.wfile.write(data)
+                remaining -= len(data)
+                sent += len(data)
+                if bandwidth:
+                    # Sleep until the connection is back under its bandwidth budget
+                    ahead = sent / bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeSite:
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        """Threaded HTTP server running the fake site in the background."""
+        self.config = config or FakeSiteConfig()
+        handler = type("BoundFakeSiteHandler", (FakeSiteHandler,), {"site": self.config})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == "__main__":
+    with FakeSite(port=8765) as site:
+        print(f"Fake AnimeFenix site running at {site.base_url} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,308 @@
+"""Offline benchmarks for the scraping pipeline, run against the local fake site.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--output report.json] [--compare previous.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# Keep benchmark runs away from the user's caches and make every request reach the fake site
+os.environ.setdefault("ANIMESCRAPER_HOME", tempfile.mkdtemp(prefix="animescraper-bench-"))
+os.environ["ANIMESCRAPER_NO_CACHE"] = "1"
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+
+from fake_site import FakeSite, FakeSiteConfig  # noqa: E402
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize(samples):
+    """Latency summary in milliseconds."""
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "mean_ms": statistics.mean(ordered) * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+        "min_ms": ordered[0] * 1000,
+    }
+
+
+def timed_runs(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_search(site, repeat):
+    from searcher import AnimeSearcher
+    searcher = AnimeSearcher(base_search_url=f"{site.base_url}/animes")
+    results = searcher.search_anime(anime_name="anime")
+    report = summarize(timed_runs(lambda: searcher.search_anime(anime_name="anime"), repeat))
+    report["results_per_search"] = len(results)
+    return report
+
+
+def bench_episode_list(site, repeat):
+    from episode_fetcher import EpisodeFetcher
+    from http_client import get_session
+    fetcher = EpisodeFetcher(get_session())
+    link = f"{site.base_url}/anime-1"
+    episodes = fetcher.fetch_episode_links("Anime 1", link)
+    report = summarize(timed_runs(lambda: fetcher.fetch_episode_links("Anime 1", link), repeat))
+    report["episodes_per_page"] = len(episodes)
+    return report
+
+
+class CollectingPipeline:
+    """Download pipeline stand-in that only records the resolved URLs."""
+
+    def __init__(self):
+        self.urls = []
+
+    def submit(self, download_url, output_dir, anime_name, chapter=None, server=None, callback=None, mirrors=None,
+               priority=0):
+        self.urls.append(download_url)
+
+
+def bench_resolution(site, chapters, page_rate):
+    from chapter_processor import ChapterProcessor
+    from rate_limiter import RateLimiter
+    from url_cache import ResolvedURLCache
+    from http_client import get_session
+    from config import SERVER_PREFERENCES, XPATH
+
+    config = {"server_preferences": SERVER_PREFERENCES, "download_button_xpath": XPATH, "base_url": site.base_url}
+    url_cache = ResolvedURLCache(os.path.join(tempfile.mkdtemp(), "resolved.sqlite3"))
+    output_dir = tempfile.mkdtemp()
+    pipeline = CollectingPipeline()
+    with ChapterProcessor(get_session(), f"{site.base_url}/anime-1", "Anime 1", config, url_cache=url_cache) as processor:
+        host = site.base_url.split("//", 1)[1]
+        processor.url_fetcher.set_rate_limiter(RateLimiter({host: {"rate": page_rate, "burst": page_rate}}))
+        started = time.perf_counter()
+        processor.process_chapters(1, chapters, output_dir, pipeline=pipeline)
+        elapsed = time.perf_counter() - started
+    return {
+        "chapters": chapters,
+        "resolved": len(pipeline.urls),
+        "seconds": elapsed,
+        "chapters_per_second": len(pipeline.urls) / elapsed if elapsed else 0,
+        "http_fast_path": processor.link_resolver.stats.summary(),
+    }
+
+
+def process_tree_rss(pid):
+    """Resident memory in MiB of a process and all its descendants (Linux /proc; None elsewhere)."""
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat", "r") as file:
+                    # The command name may contain spaces, so split after its closing parenthesis
+                    parent = int(file.read().rpartition(")")[2].split()[1])
+                children.setdefault(parent, []).append(int(entry))
+            except (OSError, ValueError, IndexError):
+                continue
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status", "r") as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total / 1024
+
+
+def bench_browser(site, resolutions):
+    """Per-resolution latency and browser memory of the full and lean resolver profiles."""
+    from browser import FULL_PROFILE, LEAN_PROFILE
+    from chapter_processor import ChapterProcessor
+    from driver_pool import DriverPool
+    from rate_limiter import RateLimiter
+    from url_cache import ResolvedURLCache
+    from http_client import get_session
+    from config import SERVER_PREFERENCES, XPATH
+
+    config = {"server_preferences": SERVER_PREFERENCES, "download_button_xpath": XPATH, "base_url": site.base_url}
+    host = site.base_url.split("//", 1)[1]
+    results = {}
+    for profile in (FULL_PROFILE, LEAN_PROFILE):
+        pool = DriverPool(size=1, profile=profile)
+        url_cache = ResolvedURLCache(os.path.join(tempfile.mkdtemp(), "resolved.sqlite3"))
+        try:
+            processor = ChapterProcessor(get_session(), f"{site.base_url}/anime-1", "Anime 1", config,
+                                         driver_pool=pool, url_cache=url_cache,
+                                         rate_limiter=RateLimiter({host: {"rate": 1000, "burst": 1000}}))
+            # The first start pays for launching Chrome; it is reported separately from the resolutions
+            started = time.perf_counter()
+            with pool.driver() as driver:
+                pid = driver.service.process.pid
+            startup = time.perf_counter() - started
+            samples, peak_rss, resolved = [], 0.0, 0
+            for episode in range(1, resolutions + 1):
+                url = f"{site.base_url}/redirect_download.php?server=mediafire&file=anime-1-{episode}"
+                started = time.perf_counter()
+                resolved += bool(processor.get_final_download_url(url))
+                samples.append(time.perf_counter() - started)
+                peak_rss = max(peak_rss, process_tree_rss(pid) or 0.0)
+        except Exception as e:
+            # Chrome or ChromeDriver missing: report why instead of failing the whole run
+            results[profile] = {"skipped": str(e).splitlines()[0] if str(e) else type(e).__name__}
+            continue
+        finally:
+            pool.close()
+        results[profile] = {**summarize(samples), "resolved": resolved, "startup_ms": startup * 1000,
+                            "peak_rss_mb": peak_rss or None}
+    return results
+
+
+def bench_download(site, repeat, server=None, streams=1):
+    """Downloads the file `streams` times in parallel per run, measuring MB/s and CPU% of each stream.
+
+    CPU% is the downloading thread's CPU time over wall time, so it only covers single-connection
+    downloads (segmented ones spread the work over extra threads) and excludes the in-process fake site.
+    """
+    from downloader import Downloader
+    from config import SERVER_SEGMENTS
+    downloader = Downloader()
+    speeds, cpu = [], []
+    aggregate = []
+    lock = threading.Lock()
+
+    def stream(index, output_dir):
+        cpu_started, started = time.thread_time(), time.perf_counter()
+        path = downloader.download_file(f"{site.base_url}/files/bench-episode-{index}.mp4", output_dir, "Bench",
+                                        server=server)
+        elapsed = time.perf_counter() - started
+        with lock:
+            speeds.append(os.path.getsize(path) / elapsed / (1024 * 1024))
+            cpu.append((time.thread_time() - cpu_started) / elapsed * 100)
+        os.remove(path)
+
+    for _ in range(repeat):
+        output_dir = tempfile.mkdtemp()
+        threads = [threading.Thread(target=stream, args=(index, output_dir)) for index in range(streams)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        aggregate.append(streams * site.config.file_size / (time.perf_counter() - started) / (1024 * 1024))
+
+    single_connection = SERVER_SEGMENTS.get(server, 1) == 1
+    return {
+        "runs": repeat,
+        "server": server,
+        "streams": streams,
+        "file_mb": site.config.file_size / (1024 * 1024),
+        "mean_mb_per_s": statistics.mean(speeds),
+        "max_mb_per_s": max(speeds),
+        "aggregate_mb_per_s": statistics.mean(aggregate),
+        "cpu_percent_per_stream": statistics.mean(cpu) if single_connection else None,
+    }
+
+
+def compare(current, previous_path):
+    """Prints the relative change of every numeric result against an earlier report."""
+    with open(previous_path, "r", encoding="utf-8") as file:
+        previous = json.load(file)
+    print(f"\nComparison with {previous.get('commit')} ({previous_path}):")
+    for section, values in current["results"].items():
+        old_values = previous.get("results", {}).get(section, {})
+        for key, value in values.items():
+            old = old_values.get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                print(f"  {section}.{key}: {old:.2f} -> {value:.2f} ({(value - old) / old * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a local fake AnimeFenix site.")
+    parser.add_argument("--output", help="JSON report path (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per latency benchmark")
+    parser.add_argument("--chapters", type=int, default=24, help="Chapters to resolve")
+    parser.add_argument("--page-rate", type=float, default=1000.0,
+                        help="Requests per second allowed by the rate limiter during resolution")
+    parser.add_argument("--file-mb", type=int, default=64, help="Size of the downloaded file in MiB")
+    parser.add_argument("--bandwidth-mb", type=float, default=0, help="Per-connection bandwidth in MiB/s (0 = unlimited)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added latency per request in milliseconds")
+    parser.add_argument("--download-runs", type=int, default=3)
+    parser.add_argument("--server", help="Server name passed to the downloader (selects SERVER_SEGMENTS)")
+    parser.add_argument("--streams", type=int, default=1, help="Concurrent downloads per download run")
+    parser.add_argument("--browser", type=int, default=0,
+                        help="Selenium resolutions per browser profile (full vs lean); needs Chrome, 0 = skip")
+    parser.add_argument("--asset-delay-ms", type=float, default=200,
+                        help="Load time of each image, font, stylesheet and ad script on mirror pages")
+    args = parser.parse_args()
+
+    site_config = FakeSiteConfig(
+        episodes=max(args.chapters, 24),
+        file_size=args.file_mb * 1024 * 1024,
+        bandwidth=int(args.bandwidth_mb * 1024 * 1024),
+        latency=args.latency_ms / 1000,
+        asset_delay=args.asset_delay_ms / 1000,
+    )
+    commit = git_commit()
+    from html_parser import PARSER
+    from metrics import metrics
+
+    with FakeSite(site_config) as site:
+        results = {
+            "search": bench_search(site, args.repeat),
+            "episode_list": bench_episode_list(site, args.repeat),
+            "resolution": bench_resolution(site, args.chapters, args.page_rate),
+            "download": bench_download(site, args.download_runs, args.server, args.streams),
+        }
+        if args.browser:
+            for profile, values in bench_browser(site, args.browser).items():
+                results[f"browser_{profile}"] = values
+
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "html_parser": PARSER,
+        "settings": vars(args),
+        "results": results,
+        "metrics": metrics.snapshot(),  # Per-stage timers collected while the benchmarks ran
+    }
+    output = args.output or os.path.join(BENCH_DIR, "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+    print(json.dumps(results, indent=2))
+    print(f"\nReport written to {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from searcher import AnimeSearcher
+from episode_fetcher import EpisodeFetcher
+from chapter_processor import ChapterProcessor
+from downloader import Downloader
+from driver_pool import DriverPool
+from pipeline import DownloadPipeline
+from rate_limiter import RateLimiter
+from url_cache import get_url_cache
+from http_client import get_session
+from catalog import CatalogIndex
+from config import (
+    BASE_URL, SERVER_PREFERENCES, XPATH, BATCH_MAX_CONCURRENCY, BATCH_USERNAME_ENV, BATCH_PASSWORD_ENV,
+    get_output_dir, sanitize_filename,
+)
+
+# Exit codes for cron: everything downloaded, some episodes failed, or the job file/login was unusable
+EXIT_OK = 0
+EXIT_PARTIAL_FAILURE = 1
+EXIT_BAD_INPUT = 2
+
+
+class JobFileError(ValueError):
+    """Raised when a batch job file cannot be read or is malformed."""
+
+
+def load_job_file(path):
+    """Reads a JSON or YAML job file. YAML needs PyYAML installed."""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            text = file.read()
+    except OSError as e:
+        raise JobFileError(f"Cannot read job file {path}: {e}")
+
+    if path.lower().endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise JobFileError("YAML job files require PyYAML (pip install pyyaml); use JSON otherwise.")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise JobFileError(f"Invalid YAML in {path}: {e}")
+    else:
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise JobFileError(f"Invalid JSON in {path}: {e}")
+
+    # A bare list of jobs is accepted as shorthand for {"jobs": [...]}
+    if isinstance(data, list):
+        data = {"jobs": data}
+    if not isinstance(data, dict) or not isinstance(data.get("jobs"), list) or not data["jobs"]:
+        raise JobFileError(f"{path} must contain a non-empty 'jobs' list.")
+    for index, job in enumerate(data["jobs"], start=1):
+        if not isinstance(job, dict) or not (job.get("title") or job.get("slug")):
+            raise JobFileError(f"Job #{index} needs a 'title' or a 'slug'.")
+    return data
+
+
+def parse_episode_spec(spec):
+    """Turns "1-12", "1-3,7,9-10", [1, 2, 5] or {"start": 1, "end": 12} into a sorted list of episode numbers.
+
+    Returns None for "all" (every episode listed on the anime page).
+    """
+    if spec is None or spec == "all":
+        return None
+    if isinstance(spec, dict):
+        return list(range(int(spec["start"]), int(spec["end"]) + 1))
+    if isinstance(spec, int):
+        return [spec]
+    if isinstance(spec, list):
+        return sorted({int(episode) for episode in spec})
+
+    episodes = set()
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = (int(value) for value in part.split('-', 1))
+            if end < start:
+                raise JobFileError(f"Invalid episode range '{part}'")
+            episodes.update(range(start, end + 1))
+        else:
+            episodes.add(int(part))
+    return sorted(episodes)
+
+
+def login_from_environment():
+    """Reuses the saved session or logs in with the credentials from the environment, if any.
+
+    Returns False only when a login was attempted and failed.
+    """
+    from session_manager import SessionManager
+    username, password = os.environ.get(BATCH_USERNAME_ENV), os.environ.get(BATCH_PASSWORD_ENV)
+    session_manager = SessionManager()
+    if session_manager.login(username, password):
+        return True
+    if not (username and password):
+        logging.info("Batch: no saved session or credentials in the environment, running without login.")
+        return True
+    return False
+
+
+class SeriesJob:
+    def __init__(self, spec, defaults):
+        """One series from the job file plus the bookkeeping for its summary."""
+        self.title = spec.get("title")
+        self.slug = spec.get("slug")
+        self.name = spec.get("name") or self.title or self.slug
+        self.episode_spec = spec.get("episodes", "all")
+        self.output_root = spec.get("output_root") or defaults.get("output_root")
+        self.servers = spec.get("servers") or defaults.get("servers") or SERVER_PREFERENCES
+        self.priority = int(spec.get("priority") or 0)  # true or a number; higher series download first
+        self.link = None
+        self.output_dir = None
+        self.episodes = []
+        self.processor = None
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.downloaded = 0
+        self.failed = []
+        self.error = None
+
+    def record_download(self, episode, result):
+        with self.lock:
+            if result:
+                self.downloaded += 1
+            else:
+                self.failed.append(episode)
+
+    def record_failure(self, episode):
+        with self.lock:
+            self.failed.append(episode)
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "link": self.link,
+            "output_dir": self.output_dir,
+            "episodes": len(self.episodes),
+            "downloaded": self.downloaded,
+            "failed": sorted(self.failed),
+            "error": self.error,
+        }
+
+
+class BatchRunner:
+    def __init__(self, job_data, session=None, max_concurrency=BATCH_MAX_CONCURRENCY):
+        """Runs every series in a job file through one scheduler with shared pools and rate limits."""
+        self.defaults = {key: value for key, value in job_data.items() if key != "jobs"}
+        self.jobs = [SeriesJob(spec, self.defaults) for spec in job_data["jobs"]]
+        self.session = session or get_session()
+        self.max_concurrency = int(self.defaults.get("max_concurrency") or max_concurrency)
+        self.searcher = AnimeSearcher(session=self.session)
+        self.episode_fetcher = EpisodeFetcher(self.session)
+        self.catalog = CatalogIndex()
+        # Shared by every series: one browser pool, one set of per-host buckets, one download queue
+        self.rate_limiter = RateLimiter()
+        self.url_cache = get_url_cache()
+        self.driver_pool = DriverPool()
+        self.pipeline = DownloadPipeline(Downloader(session=self.session, url_cache=self.url_cache))
+        self.login_failed = False
+        self.elapsed = 0.0
+
+    def login(self):
+        return login_from_environment()
+
+    def resolve_series(self, job):
+        """Finds the anime link and the list of episodes for a job. Returns False if the series is unusable."""
+        if job.slug:
+            job.link = f"{BASE_URL}/{job.slug}"
+        else:
+            results = self.catalog.search(anime_name=job.title) if self.catalog.count() else []
+            results = results or self.searcher.search_anime(anime_name=job.title)
+            if not results:
+                job.error = f"No search results for '{job.title}'"
+                return False
+            # Prefer an exact title match, otherwise take the top result
+            exact = [anime for anime in results if anime["title"].strip().lower() == job.title.strip().lower()]
+            match = (exact or results)[0]
+            job.link = match["link"]
+            job.name = job.name if job.name != job.title else match["title"]
+
+        episodes = parse_episode_spec(job.episode_spec)
+        if episodes is None:
+            listed = self.episode_fetcher.fetch_episode_links(job.name, job.link)
+            episodes = [episode['number'] for episode in listed]
+        if not episodes:
+            job.error = "No episodes to download"
+            return False
+        job.episodes = episodes
+
+        sanitized_name = sanitize_filename(job.name.replace(" ", "-").lower())
+        job.output_dir = os.path.join(job.output_root, sanitized_name) if job.output_root else get_output_dir(sanitized_name)
+        os.makedirs(job.output_dir, exist_ok=True)
+
+        config = {"server_preferences": job.servers, "download_button_xpath": XPATH, "priority": job.priority}
+        job.processor = ChapterProcessor(self.session, job.link, job.name, config, driver_pool=self.driver_pool,
+                                         url_cache=self.url_cache, rate_limiter=self.rate_limiter)
+        return True
+
+    def enqueue(self, work_queue):
+        """Resolves every series and adds its episodes to a shared WorkQueue instead of downloading them here.
+
+        Returns the exit code.
+        """
+        for job in self.jobs:
+            try:
+                if self.resolve_series(job):
+                    slug = job.link.rstrip('/').rsplit('/', 1)[-1]
+                    added = work_queue.enqueue(slug, job.name, job.output_dir, job.episodes, job.servers, job.priority)
+                    logging.info(f"Queue: {job.name} -> {added} new of {len(job.episodes)} episodes")
+            except Exception as e:
+                job.error = str(e)
+            if job.error:
+                logging.error(f"Queue: skipping {job.name}: {job.error}")
+        return EXIT_PARTIAL_FAILURE if any(job.error for job in self.jobs) else EXIT_OK
+
+    def run_episode(self, job, episode):
+        """Resolves one episode and queues it; failures are recorded on the job."""
+        try:
+            queued = job.processor.process_chapter(
+                episode, job.output_dir, self.pipeline,
+                on_downloaded=lambda result: job.record_download(episode, result),
+            )
+        except Exception as e:
+            logging.error(f"Error processing {job.name} episode {episode}: {e}")
+            queued = False
+        if queued:
+            with job.lock:
+                job.queued += 1
+        else:
+            job.record_failure(episode)
+
+    def run(self):
+        """Processes every job and returns the exit code."""
+        started = time.time()
+        if not self.login():
+            logging.error("Batch: login failed, aborting.")
+            self.login_failed = True
+            self.driver_pool.close()
+            return self.exit_code()
+        ready = []
+        for job in self.jobs:
+            try:
+                if self.resolve_series(job):
+                    ready.append(job)
+                    logging.info(f"Batch: {job.name} -> {len(job.episodes)} episodes into {job.output_dir}")
+            except Exception as e:
+                job.error = str(e)
+            if job.error:
+                logging.error(f"Batch: skipping {job.name}: {job.error}")
+
+        # One global worker pool over all (series, episode) pairs: flagged series first, then the lowest
+        # episode numbers of every series, so each series gets watchable episodes early
+        tasks = sorted(((job, episode) for job in ready for episode in job.episodes),
+                       key=lambda task: (-task[0].priority, task[1]))
+        self.pipeline.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                futures = [executor.submit(self.run_episode, job, episode) for job, episode in tasks]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            self.pipeline.close()
+            self.driver_pool.close()
+
+        self.elapsed = time.time() - started
+        return self.exit_code()
+
+    def exit_code(self):
+        if self.login_failed:
+            return EXIT_BAD_INPUT
+        if any(job.error or job.failed for job in self.jobs):
+            return EXIT_PARTIAL_FAILURE
+        return EXIT_OK
+
+    def summary(self):
+        jobs = [job.summary() for job in self.jobs]
+        return {
+            "exit_code": self.exit_code(),
+            "seconds": self.elapsed,
+            "series": len(jobs),
+            "episodes": sum(job["episodes"] for job in jobs),
+            "downloaded": sum(job["downloaded"] for job in jobs),
+            "failed": sum(len(job["failed"]) for job in jobs),
+            "jobs": jobs,
+        }
+
+    def summary_text(self):
+        """One line per series plus totals, suitable for a cron mail."""
+        summary = self.summary()
+        lines = []
+        for job in summary["jobs"]:
+            if job["error"]:
+                lines.append(f"FAILED  {job['name']}: {job['error']}")
+                continue
+            status = "OK     " if not job["failed"] else "PARTIAL"
+            line = f"{status} {job['name']}: {job['downloaded']}/{job['episodes']} episodes"
+            if job["failed"]:
+                line += f" (failed: {', '.join(str(episode) for episode in job['failed'])})"
+            lines.append(line)
+        lines.append(f"Total: {summary['downloaded']}/{summary['episodes']} episodes across {summary['series']} series "
+                     f"in {summary['seconds']:.0f}s, {summary['failed']} failed")
+        return "\n".join(lines)
@@ -0,0 +1,114 @@
+import os
+import shutil
+import logging
+import threading
+import time
+from config import CHROMEDRIVER_PATH_CACHE, CHROMEDRIVER_CACHE_TTL, RESOLVER_WINDOW_SIZE, RESOLVER_BLOCKED_URLS
+
+FULL_PROFILE = "full"
+LEAN_PROFILE = "lean"
+
+# Chrome content settings: 2 = block
+_LEAN_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.managed_default_content_settings.notifications": 2,
+    "profile.managed_default_content_settings.geolocation": 2,
+    "profile.managed_default_content_settings.media_stream": 2,
+    "profile.managed_default_content_settings.plugins": 2,
+}
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def _read_cached_driver_path():
+    """Path saved by an earlier run, if it still exists and is recent enough to skip the version check."""
+    try:
+        if time.time() - os.path.getmtime(CHROMEDRIVER_PATH_CACHE) > CHROMEDRIVER_CACHE_TTL:
+            return None
+        with open(CHROMEDRIVER_PATH_CACHE, 'r', encoding='utf-8') as file:
+            path = file.read().strip()
+    except OSError:
+        return None
+    return path if path and os.path.isfile(path) else None
+
+
+def _write_cached_driver_path(path):
+    try:
+        os.makedirs(os.path.dirname(CHROMEDRIVER_PATH_CACHE), exist_ok=True)
+        with open(CHROMEDRIVER_PATH_CACHE, 'w', encoding='utf-8') as file:
+            file.write(path)
+    except OSError as e:
+        logging.warning(f"Could not cache the ChromeDriver path: {e}")
+
+
+def chromedriver_path():
+    """Resolves the ChromeDriver binary once per process.
+
+    Order: CHROMEDRIVER_PATH env var, the path cached by an earlier run, chromedriver on PATH, and only then
+    webdriver_manager (which checks versions over the network).
+    """
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path:
+            return _driver_path
+        path = os.environ.get("CHROMEDRIVER_PATH") or _read_cached_driver_path() or shutil.which("chromedriver")
+        if not path:
+            from webdriver_manager.chrome import ChromeDriverManager
+            path = ChromeDriverManager().install()
+            _write_cached_driver_path(path)
+        logging.info(f"Using ChromeDriver at {path}")
+        _driver_path = path
+        return path
+
+
+def create_driver(headless=True, profile=FULL_PROFILE):
+    """Creates a Chrome WebDriver used to follow download redirects and to log in.
+
+    The lean profile is for link resolution only: it returns from page loads at DOMContentLoaded and does
+    not fetch images, media, fonts, stylesheets or known ad/tracker hosts.
+    """
+    # Selenium takes a noticeable time to import, so only pay for it when a browser is started
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-popup-blocking")
+    if profile == LEAN_PROFILE:
+        options.page_load_strategy = "eager"
+        options.add_argument(f"--window-size={RESOLVER_WINDOW_SIZE}")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--autoplay-policy=user-gesture-required")
+        options.add_argument("--mute-audio")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-background-networking")
+        options.add_argument("--disable-component-update")
+        options.add_argument("--disable-default-apps")
+        options.add_argument("--disable-sync")
+        options.add_argument("--no-first-run")
+        options.add_argument("--disable-features=Translate,MediaRouter,OptimizationHints")
+        options.add_experimental_option("prefs", _LEAN_PREFS)
+
+    service = Service(chromedriver_path())
+    driver = webdriver.Chrome(service=service, options=options)
+    if profile == LEAN_PROFILE:
+        block_resources(driver)
+    return driver
+
+
+def block_resources(driver):
+    """Blocks RESOLVER_BLOCKED_URLS in the driver's current tab through the DevTools protocol.
+
+    Blocking is per tab, so call it again after switching to a tab opened by a redirect.
+    """
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": RESOLVER_BLOCKED_URLS})
+    except Exception as e:
+        # Not a Chromium driver, or the tab is already gone; the content settings still apply
+        logging.debug(f"Could not block resources in this tab: {e}")
@@ -0,0 +1,273 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import requests
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from searcher import AnimeSearcher
+from rate_limiter import RateLimiter
+from http_client import get_session
+from http_cache import get_cache
+from html_parser import make_soup
+from url_fetcher import URLFetcher
+from config import (
+    CATALOG_DB, CATALOG_ORDER, CATALOG_NEWEST_FIRST_ORDERS, CATALOG_FETCH_BATCH, CATALOG_STOP_AFTER_UNCHANGED,
+    CATALOG_FETCH_GENRES, CATALOG_PARSE_PROCESSES, CATALOG_SEARCH_LIMIT, STATUS_NAMES,
+)
+
+ANIME_FIELDS = ("title", "link", "image_url", "year", "status")
+
+
+def parse_anime_genres(html):
+    """Extracts the genre names from an anime page (genre links point at /animes?genero[]=...)."""
+    soup = make_soup(html)
+    genres = []
+    for link in soup.select('a[href*="genero"]'):
+        name = link.text.strip()
+        if name and name not in genres:
+            genres.append(name)
+    return genres
+
+
+class CatalogIndex:
+    def __init__(self, db_path=CATALOG_DB):
+        """Local SQLite copy of the /animes listing with a full-text index over titles and genres."""
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS animes (
+                    link TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    image_url TEXT,
+                    year TEXT,
+                    status TEXT,
+                    genres TEXT NOT NULL DEFAULT '',
+                    updated_at REAL NOT NULL
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS listing_pages (
+                    page INTEGER PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            try:
+                connection.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS anime_fts USING fts5(link UNINDEXED, title, genres)"
+                )
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: searches fall back to LIKE on the animes table
+                logging.warning("SQLite FTS5 is not available; catalog searches will use LIKE.")
+                self.fts = False
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def count(self):
+        with closing(self._connect()) as connection:
+            return connection.execute("SELECT COUNT(*) FROM animes").fetchone()[0]
+
+    def page_hash(self, page):
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT content_hash FROM listing_pages WHERE page = ?", (page,)).fetchone()
+        return row[0] if row else None
+
+    def save_page_hash(self, page, content_hash):
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO listing_pages (page, content_hash, fetched_at) VALUES (?, ?, ?)",
+                (page, content_hash, time.time()),
+            )
+
+    def changed_entries(self, animes):
+        """Returns the entries that are new or differ from what is stored."""
+        changed = []
+        with closing(self._connect()) as connection:
+            for anime in animes:
+                row = connection.execute(
+                    "SELECT title, link, image_url, year, status FROM animes WHERE link = ?", (anime["link"],)
+                ).fetchone()
+                if row != tuple(anime[field] for field in ANIME_FIELDS):
+                    changed.append(anime)
+        return changed
+
+    def upsert(self, animes):
+        """Inserts or updates entries (and their full-text rows). Genres are kept unless provided."""
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            for anime in animes:
+                row = connection.execute("SELECT genres FROM animes WHERE link = ?", (anime["link"],)).fetchone()
+                genres = anime.get("genres")
+                genres = ", ".join(genres) if genres is not None else (row[0] if row else "")
+                connection.execute(
+                    "INSERT OR REPLACE INTO animes (link, title, image_url, year, status, genres, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (anime["link"], anime["title"], anime["image_url"], anime["year"], anime["status"], genres, now),
+                )
+                if self.fts:
+                    connection.execute("DELETE FROM anime_fts WHERE link = ?", (anime["link"],))
+                    connection.execute("INSERT INTO anime_fts (link, title, genres) VALUES (?, ?, ?)",
+                                       (anime["link"], anime["title"], genres))
+
+    @staticmethod
+    def _match_query(text):
+        """Turns free text into an FTS5 query matching every word as a prefix."""
+        words = re.findall(r"\w+", text, flags=re.UNICODE)
+        return " ".join(f'"{word}"*' for word in words)
+
+    def search(self, anime_name=None, genres=None, years=None, statuses=None, limit=CATALOG_SEARCH_LIMIT):
+        """Answers name or filter searches from the local index, returning the same dicts as AnimeSearcher.
+
+        At most `limit` matches are returned; a warning is logged when more exist.
+        """
+        clauses, args = [], []
+        fts_terms = []
+        if anime_name:
+            if self.fts:
+                fts_terms.append(self._match_query(anime_name))
+            else:
+                clauses.append("a.title LIKE ?")
+                args.append(f"%{anime_name}%")
+        else:
+            for genre in genres or []:
+                if self.fts:
+                    fts_terms.append(f"genres : ({self._match_query(genre)})")
+                else:
+                    clauses.append("a.genres LIKE ?")
+                    args.append(f"%{genre}%")
+            if years:
+                clauses.append(f"a.year IN ({', '.join('?' for _ in years)})")
+                args.extend(str(year) for year in years)
+            if statuses:
+                names = [STATUS_NAMES.get(str(status), str(status)) for status in statuses]
+                clauses.append(f"a.status IN ({', '.join('?' for _ in names)})")
+                args.extend(names)
+
+        fts_terms = [term for term in fts_terms if term]
+        if fts_terms:
+            query = ("SELECT a.title, a.link, a.image_url, a.year, a.status FROM anime_fts f "
+                     "JOIN animes a ON a.link = f.link WHERE anime_fts MATCH ?")
+            args.insert(0, " AND ".join(fts_terms))
+            where = "".join(f" AND {clause}" for clause in clauses)
+            order = " ORDER BY f.rank"
+        else:
+            query = "SELECT a.title, a.link, a.image_url, a.year, a.status FROM animes a"
+            where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+            order = " ORDER BY a.title"
+
+        with closing(self._connect()) as connection:
+            rows = connection.execute(query + where + order + " LIMIT ?", (*args, limit + 1)).fetchall()
+        if len(rows) > limit:
+            logging.warning(f"Catalog search matched more than {limit} animes; only the first {limit} are shown")
+            rows = rows[:limit]
+        return [dict(zip(ANIME_FIELDS, row)) for row in rows]
+
+
+class CatalogSync:
+    def __init__(self, index=None, searcher=None, session=None):
+        """Crawls the /animes listing into a CatalogIndex, parsing pages on every CPU core."""
+        self.index = index or CatalogIndex()
+        self.session = session or get_session()
+        self.searcher = searcher or AnimeSearcher(session=self.session)
+        self.cache = get_cache()
+        self.rate_limiter = RateLimiter()
+
+    def fetch(self, url, params=None):
+        """Fetches a page through the HTTP cache, always revalidated: the "catalog" endpoint has no TTL.
+
+        Unchanged pages come back as a 304 with the stored body, so their page hash matches and they are not
+        parsed again.
+        """
+        try:
+            response = self.cache.get(self.session, url, params=params, endpoint="catalog", rate_limiter=self.rate_limiter,
+                                      validate=lambda response: not URLFetcher.is_blocked_page(response.text))
+            return response.text
+        except requests.RequestException as e:
+            logging.error(f"Catalog sync could not fetch {url}: {e}")
+            return None
+
+    def fetch_listing_page(self, page):
+        params = {'order': CATALOG_ORDER}
+        if page > 1:
+            params['page'] = page
+        return self.fetch(self.searcher.BASE_SEARCH_URL, params=params)
+
+    def run(self, full=False):
+        """Synchronizes the index. Incremental runs stop after CATALOG_STOP_AFTER_UNCHANGED unchanged pages.
+
+        Stopping early is only safe when the listing is crawled newest-first; with any other CATALOG_ORDER new
+        entries can sit behind unchanged pages, so the whole listing is diffed.
+        """
+        started = time.time()
+        stop_early = not full and CATALOG_ORDER in CATALOG_NEWEST_FIRST_ORDERS
+        stats = {"pages": 0, "pages_parsed": 0, "added_or_updated": 0}
+        unchanged_streak = 0
+        page = 1
+        with ThreadPoolExecutor(max_workers=CATALOG_FETCH_BATCH) as fetchers, \
+                ProcessPoolExecutor(max_workers=CATALOG_PARSE_PROCESSES) as parsers:
+            while True:
+                pages = list(range(page, page + CATALOG_FETCH_BATCH))
+                htmls = list(fetchers.map(self.fetch_listing_page, pages))
+                page += CATALOG_FETCH_BATCH
+
+                # Skip parsing pages whose HTML is byte-for-byte what we indexed last time
+                to_parse = []
+                for number, html in zip(pages, htmls):
+                    if html is None:
+                        continue
+                    content_hash = hashlib.sha256(html.encode('utf-8')).hexdigest()
+                    if not full and content_hash == self.index.page_hash(number):
+                        to_parse.append((number, content_hash, None))
+                    else:
+                        to_parse.append((number, content_hash, html))
+
+                parsed = parsers.map(AnimeSearcher.parse_search_results,
+                                     [html for _, _, html in to_parse if html is not None])
+                parsed = iter(list(parsed))
+
+                reached_end = False
+                for number, content_hash, html in to_parse:
+                    stats["pages"] += 1
+                    if html is None:
+                        unchanged_streak += 1
+                        continue
+                    stats["pages_parsed"] += 1
+                    animes = next(parsed)
+                    if not animes:
+                        reached_end = True  # Past the last listing page
+                        break
+                    changed = self.index.changed_entries(animes) if not full else animes
+                    if changed:
+                        unchanged_streak = 0
+                        self.store(changed, parsers, fetchers)
+                        stats["added_or_updated"] += len(changed)
+                    else:
+                        unchanged_streak += 1
+                    self.index.save_page_hash(number, content_hash)
+
+                # A failed fetch also ends the crawl so the index never silently skips a page
+                if reached_end or any(html is None for html in htmls):
+                    break
+                if stop_early and unchanged_streak >= CATALOG_STOP_AFTER_UNCHANGED:
+                    logging.info("Catalog sync reached already indexed pages, stopping early.")
+                    break
+
+        stats["seconds"] = time.time() - started
+        stats["total"] = self.index.count()
+        logging.info(f"Catalog sync finished: {stats}")
+        return stats
+
+    def store(self, animes, parsers, fetchers):
+        """Saves new or changed entries, fetching their genres from the anime pages when enabled."""
+        if CATALOG_FETCH_GENRES:
+            pages = list(fetchers.map(lambda anime: self.fetch(anime["link"]), animes))
+            genres = parsers.map(parse_anime_genres, [html or "" for html in pages])
+            for anime, anime_genres in zip(animes, genres):
+                anime["genres"] = anime_genres
+        self.index.upsert(animes)
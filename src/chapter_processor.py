@@ -1,92 +1,148 @@
 import os
-import random
 import logging
-import time
-from bs4 import BeautifulSoup
-from tqdm import tqdm
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from url_fetcher import URLFetcher
+from html_parser import make_soup, DOWNLOAD_LINKS_STRAINER
 from downloader import Downloader
-from selenium import webdriver
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException
+from rate_limiter import RateLimiter
+from driver_pool import DriverPool
+from browser import LEAN_PROFILE, block_resources
+from link_resolver import LinkResolver
+from pipeline import DownloadPipeline
+from url_cache import get_url_cache
+from metrics import metrics
+from logger import dump_debug
+from config import PAGE_FETCH_WORKERS, BASE_URL
 
 
 
 class ChapterProcessor:
-    def __init__(self, session, anime_link, anime_name, config):
+    def __init__(self, session, anime_link, anime_name, config, driver_pool=None, url_cache=None, rate_limiter=None):
         self.url_fetcher = URLFetcher()  # Initialize your URLFetcher
         self.url_fetcher.set_session(session)
-        self.downloader = Downloader()  # Use the existing Downloader class
+        # Per-host throttling replaces the fixed sleep; batch runs share one limiter across series
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.url_fetcher.set_rate_limiter(self.rate_limiter)
+        self.url_cache = url_cache or get_url_cache()  # Final URLs resolved in earlier runs
+        self.downloader = Downloader(url_cache=self.url_cache)  # Use the existing Downloader class
         self.anime_link = anime_link.split("/")[-1]  # Extract only the slug from the full URL
         self.anime_name = anime_name  # Store the anime name
-        self.driver = None  # Initialize as None
         self.config = config  # Store configuration
-        self.setup_driver()  # Initialize Selenium WebDriver
-        
-
-    def setup_driver(self):
-        """Sets up the Selenium WebDriver."""
-        options = webdriver.ChromeOptions()
-        #options.add_argument("--headless")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-popup-blocking")
-
-        service = Service(ChromeDriverManager().install())  # Install and use ChromeDriver
-        self.driver = webdriver.Chrome(service=service, options=options)
-
-    def process_chapters(self, start_chapter, end_chapter, output_dir):
+        # Browsers are started lazily by the pool; only close the pool if we created it
+        self.owns_driver_pool = driver_pool is None
+        self.driver_pool = driver_pool or DriverPool()
+        # Plain HTTP first, pooled Selenium only when the page needs a real browser
+        self.link_resolver = LinkResolver(self.url_fetcher, self.get_final_download_url)
+
+    def process_chapters(self, start_chapter, end_chapter, output_dir, pipeline=None):
+        """Resolves each chapter and hands it to the download pipeline as soon as its URL is known."""
         # Ensure the output directory exists
         os.makedirs(output_dir, exist_ok=True)
 
-        download_urls = []  # List to hold all download URLs
-
-        for chapter in tqdm(range(start_chapter, end_chapter + 1), desc="Fetching URLs"):
-            page_url = self.construct_page_url(chapter)
-            download_page_url = f"{page_url}/descarga"  # Append "/descarga" for the download link page
-
-            # Fetch the download page content with error handling
-            try:
-                html_content = self.url_fetcher.get_page_content(download_page_url)
-            except Exception as e:
-                logging.error(f"Failed to fetch download page content for chapter {chapter}: {e}")
-                continue  # Skip to the next chapter
-
-            if html_content:
-                # Parse the download page to find the preferred download link
-                initial_url = self.get_download_link(html_content)
-
-                if initial_url:
-                    # Use Selenium to retrieve the final download link with retry handling
-                    final_download_url = self.get_final_download_url(initial_url)
-                    if final_download_url:
-                        download_urls.append(final_download_url)
-                        logging.info(f"Chapter {chapter} processing complete.")
-                    else:
-                        logging.warning(f"Failed to retrieve final download URL for chapter {chapter}")
-                else:
-                    logging.warning(f"Failed to fetch initial download URL for chapter {chapter}")
-            else:
+        from tqdm import tqdm
+        chapters = range(start_chapter, end_chapter + 1)
+        owns_pipeline = pipeline is None
+        if owns_pipeline:
+            pipeline = DownloadPipeline(self.downloader).start()
+
+        try:
+            # The worker count is only a ceiling: each host's AIMD controller decides how many page fetches
+            # actually run, browser fallbacks are capped by the pool size, and workers block on the
+            # pipeline's bounded queue when downloads fall behind
+            with ThreadPoolExecutor(max_workers=max(self.driver_pool.size, PAGE_FETCH_WORKERS)) as executor:
+                future_to_chapter = {
+                    executor.submit(self.process_chapter, chapter, output_dir, pipeline): chapter for chapter in chapters
+                }
+                for future in tqdm(as_completed(future_to_chapter), total=len(future_to_chapter), desc="Fetching URLs"):
+                    chapter = future_to_chapter[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logging.error(f"Error processing chapter {chapter}: {e}")
+        finally:
+            if owns_pipeline:
+                pipeline.close()
+                logging.info("All downloads finished.")
+
+        self.link_resolver.stats.log_summary()
+
+    def process_chapter(self, chapter, output_dir, pipeline, on_downloaded=None):
+        """Fetches, parses and resolves a single chapter, then queues it for download. Returns True on success.
+
+        `on_downloaded(path_or_none)` is called by the pipeline once the download finishes.
+        """
+        # URLs resolved in an earlier run skip the page fetch and resolution entirely
+        mirrors = self.url_cache.get_all(self.anime_link, chapter, self.config["server_preferences"])
+        if mirrors:
+            metrics.inc("resolved_url_cache_hits_total")
+            logging.info(f"Chapter {chapter} resolved from cache, queueing download.")
+        else:
+            html_content = self.fetch_download_page(chapter)
+            if not html_content:
                 logging.error(f"Failed to access download page for chapter {chapter}")
-
-            time.sleep(random.uniform(1, 3))  # Sleep to avoid being blocked
-
-        # Now download all the collected URLs using the Downloader class
-        if download_urls:
-            self.downloader.download_files(download_urls, output_dir, self.anime_name)
-            logging.info("All downloads initiated.")
+                return False
+
+            # Parse the download page to find every preferred download link
+            candidates = self.get_download_links(html_content)
+            if not candidates:
+                logging.warning(f"Failed to fetch initial download URL for chapter {chapter}")
+                return False
+
+            mirrors = self.resolve_mirrors(candidates)
+            if not mirrors:
+                logging.warning(f"Failed to retrieve final download URL for chapter {chapter}")
+                return False
+            for server, final_download_url in mirrors:
+                self.url_cache.put(self.anime_link, chapter, server, final_download_url)
+
+        # The downloader probes the mirrors and starts with the fastest; the rest are its failover list
+        server, final_download_url = mirrors[0]
+        logging.info(f"Chapter {chapter} resolved ({len(mirrors)} mirror(s)), queueing download.")
+        pipeline.submit(final_download_url, output_dir, self.anime_name, chapter, server, callback=on_downloaded,
+                        mirrors=mirrors, priority=self.config.get("priority", 0))
+        return True
+
+    def resolve_mirrors(self, candidates):
+        """Resolves every candidate concurrently. Returns the (server, final_url) pairs that resolved, in order.
+
+        Only the preferred server may fall back to the browser; the others are kept when plain HTTP suffices,
+        so extra mirrors never cost extra Chrome sessions.
+        """
+        def resolve(index):
+            server, initial_url = candidates[index]
+            return self.link_resolver.resolve(initial_url, server, allow_browser=index == 0)
+
+        with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            final_urls = list(executor.map(resolve, range(len(candidates))))
+        return [(server, final_url) for (server, _), final_url in zip(candidates, final_urls) if final_url]
+
+    def fetch_download_page(self, chapter):
+        """Fetches the download page of a single chapter."""
+        page_url = self.construct_page_url(chapter)
+        download_page_url = f"{page_url}/descarga"  # Append "/descarga" for the download link page
+        return self.url_fetcher.get_page_content(download_page_url)
 
     def construct_page_url(self, chapter):
         """Constructs the page URL dynamically."""
-        return f"https://www3.animefenix.tv/ver/{self.anime_link}-{chapter}"
+        base_url = self.config.get("base_url", BASE_URL)
+        return f"{base_url}/ver/{self.anime_link}-{chapter}"
 
     def get_download_link(self, page_content):
-        """Extracts download links from the page content and prioritizes servers based on config."""
-        soup = BeautifulSoup(page_content, 'html.parser')
+        """Extracts download links from the page content and prioritizes servers based on config.
+
+        Returns the URL of the most preferred server, or None if no preferred server was found.
+        """
+        links = self.get_download_links(page_content)
+        return links[0][1] if links else None
+
+    def get_download_links(self, page_content):
+        """Returns every (server, url) on the download page for a preferred server, in preference order."""
+        with metrics.timer("parse_download_page_seconds"):
+            return self._select_download_links(page_content)
+
+    def _select_download_links(self, page_content):
+        soup = make_soup(page_content, parse_only=DOWNLOAD_LINKS_STRAINER)
         download_links = {}
 
         # Find all download links in the 'space-y-4' section
@@ -102,56 +158,81 @@ class ChapterProcessor:
                         download_links[server] = url
                         break  # Stop searching once the server is matched
 
-        # Try preferred servers in the order defined in server_preferences
-        for server in self.config["server_preferences"]:
-            if server in download_links:
-                logging.info(f"Selected download link from {server}: {download_links[server]}")
-                return download_links[server]
-
-        # If no preferred link was found
-        logging.warning("No preferred download link found.")
-        return None
+        # Keep every preferred server, in the order defined in server_preferences, as mirror candidates
+        candidates = [(server, download_links[server]) for server in self.config["server_preferences"]
+                      if server in download_links]
+        if candidates:
+            logging.info(f"Found download links for: {', '.join(server for server, _ in candidates)}")
+        else:
+            logging.warning("No preferred download link found.")
+        return candidates
 
     def get_final_download_url(self, initial_url, max_retries=3, wait_time=5):
-        """Uses Selenium to open the initial URL and retrieve the final download link with retries."""
-        self.driver.get(initial_url)
+        """Uses a pooled Selenium driver to open the initial URL and retrieve the final download link with retries."""
+        with metrics.timer("selenium_resolve_seconds"):
+            with self.driver_pool.driver() as driver:
+                return self._resolve_with_driver(driver, initial_url, max_retries, wait_time)
+
+    def _resolve_with_driver(self, driver, initial_url, max_retries, wait_time):
+        self.rate_limiter.wait(initial_url)
+        driver.get(initial_url)
         logging.info(f"Opening URL: {initial_url}")
 
+        # Selenium is only imported once a browser is actually needed
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import NoSuchElementException
+
         # Retry mechanism
         for attempt in range(max_retries):
             try:
                 # Get current window handle
-                original_window = self.driver.current_window_handle
+                original_window = driver.current_window_handle
 
                 # Switch to the new tab
-                for window_handle in self.driver.window_handles:
+                for window_handle in driver.window_handles:
                     if window_handle != original_window:
-                        self.driver.switch_to.window(window_handle)
-                        logging.info(f"Switched to new tab, current URL: {self.driver.current_url}")
+                        driver.switch_to.window(window_handle)
+                        if self.driver_pool.profile == LEAN_PROFILE:
+                            block_resources(driver)  # Request blocking is per tab
+                        logging.info(f"Switched to new tab, current URL: {driver.current_url}")
                         break
 
                 # Wait for the final URL to load
-                WebDriverWait(self.driver, wait_time).until(EC.url_changes(initial_url))
-                final_url = self.driver.current_url  # Retrieve the current URL after the redirect
+                WebDriverWait(driver, wait_time).until(EC.url_changes(initial_url))
+                final_url = driver.current_url  # Retrieve the current URL after the redirect
                 logging.info(f"Final download URL retrieved: {final_url}")
                 
                 try:
-                    download_button = self.driver.find_element(By.ID, "downloadButton")
+                    download_button = driver.find_element(By.ID, "downloadButton")
                     final_url = download_button.get_attribute("href")
                     logging.info(f"Found final URL: {final_url}")
                     return final_url
                 except NoSuchElementException:
                     logging.error("Download button not found on attempt " + str(attempt + 1))
-                    logging.error("Download button not found. Page source: " + self.driver.page_source)
+                    # Page source is hundreds of KB; it goes to a capped dump file only with --debug-dumps
+                    dump = dump_debug("download-page", lambda: driver.page_source)
+                    if dump:
+                        logging.debug(f"Page source saved to {dump}")
 
             except Exception as e:
                 logging.error(f"Attempt {attempt + 1} failed: {e}")
-                time.sleep(wait_time)  # Wait before retrying
+                metrics.inc("selenium_retries_total")
+                # The host's controller decides how long to hold off instead of a fixed sleep
+                self.rate_limiter.get_throttle(urlparse(initial_url).netloc).on_error()
+                self.rate_limiter.wait(initial_url)
 
         logging.error(f"Failed to retrieve final download URL after {max_retries} attempts.")
         return None
 
-    def __del__(self):
-        """Close the WebDriver when the ChapterProcessor instance is deleted."""
-        if self.driver:
-            self.driver.quit()
+    def close(self):
+        """Closes the WebDriver pool if this processor created it."""
+        if self.owns_driver_pool:
+            self.driver_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,12 +1,194 @@
 # config.py
-LOGIN_URL = "https://www3.animefenix.tv/user/login"
-BASE_SEARCH_URL = "https://www3.animefenix.tv/animes"
+import os
+import re
+
+BASE_URL = "https://www3.animefenix.tv"
+LOGIN_URL = f"{BASE_URL}/user/login"
+BASE_SEARCH_URL = f"{BASE_URL}/animes"
 
 # Add server preferences here
 SERVER_PREFERENCES = ["mediafire", "mega", "1ficher"]  # Replace with actual server names
 
+# Parallel byte-range connections per file for each server (1 = single connection)
+SERVER_SEGMENTS = {"mediafire": 4, "mega": 1, "1ficher": 2}
+SEGMENT_MIN_SIZE = 16 * 1024 * 1024  # Smaller files are not worth splitting
+SEGMENT_RETRIES = 3  # Retries per segment before the whole download is retried
+
 XPATH = "//a[contains(@href, 'redirect_download.php')]"
 
+# Replace illegal characters with underscores for file and directory names
+def sanitize_filename(filename):
+    return re.sub(r'[<>:"/\\|?*]', '_', filename)
+
 # Function to get the output directory based on the anime name
 def get_output_dir(anime_name):
-    return f"d:/Series/{anime_name}"
\ No newline at end of file
+    return f"d:/Series/{anime_name}"
+
+# Requests per second allowed for each host (token bucket: steady rate and burst size)
+RATE_LIMITS = {
+    "www3.animefenix.tv": {"rate": 1.5, "burst": 3},
+}
+DEFAULT_RATE_LIMIT = {"rate": 2.0, "burst": 4}  # Used for hosts not listed above
+
+# AIMD tuning of each host's rate and concurrency: grow a little after every healthy window of responses,
+# cut sharply on 429/503, captchas and timeouts (pausing for Retry-After when the server sends one)
+AIMD_INITIAL_CONCURRENCY = 4  # Requests in flight per host at start (override per host with "concurrency")
+AIMD_MIN_CONCURRENCY = 1
+AIMD_MAX_CONCURRENCY = 16
+AIMD_MIN_RATE = 0.2  # Requests per second
+AIMD_MAX_RATE = 20.0
+AIMD_RATE_STEP = 0.5  # Added to the rate after each healthy window
+AIMD_CONCURRENCY_STEP = 1  # Added to the concurrency after each healthy window
+AIMD_DECREASE_FACTOR = 0.5  # Rate and concurrency are multiplied by this on a throttling signal
+AIMD_WINDOW = 10  # Responses per evaluation window
+AIMD_MAX_ERROR_RATE = 0.2  # Share of 5xx/connection errors in a window that also triggers a decrease
+AIMD_SLOW_FACTOR = 3.0  # Responses slower than this multiple of the usual latency do not count as healthy
+AIMD_BACKOFF_SECONDS = 5.0  # Pause after a throttling signal without Retry-After; doubles while it repeats
+AIMD_MAX_BACKOFF_SECONDS = 300.0
+AIMD_DECREASE_COOLDOWN = 2.0  # Signals from requests already in flight within this many seconds count once
+
+# Upper bound on download pages fetched in parallel; the per-host AIMD controller sets the actual level
+PAGE_FETCH_WORKERS = AIMD_MAX_CONCURRENCY
+
+# Selenium WebDriver pool used to resolve final download URLs
+DRIVER_POOL_SIZE = 3  # Number of Chrome instances resolving links in parallel
+DRIVER_MAX_USES = 25  # Recycle a browser after this many resolutions
+HEADLESS_BROWSER = True
+# "lean" resolver browsers stop at DOMContentLoaded and skip images, media, fonts, stylesheets and ad/tracker
+# requests, since only the #downloadButton href is needed; "full" loads pages like a normal browser.
+# The login browser always uses "full"; it runs headless and reopens in a visible window when the login page
+# shows a CAPTCHA (interactive runs only).
+RESOLVER_BROWSER_PROFILE = "lean"
+RESOLVER_WINDOW_SIZE = "800,600"
+RESOLVER_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.css",
+    "*doubleclick.net*", "*googlesyndication.com*", "*google-analytics.com*", "*googletagmanager.com*",
+    "*adservice.google.*", "*facebook.net*", "*popads.net*", "*popcash.net*", "*propellerads*", "*adsterra*",
+    "*/ads/*",
+]
+
+# Download pipeline: files start downloading as soon as their link is resolved
+DOWNLOAD_WORKERS = 5
+DOWNLOAD_QUEUE_SIZE = 10  # Resolvers pause when this many resolved links are waiting
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes read per call into the reused transfer buffer
+DOWNLOAD_PROGRESS_INTERVAL = 0.5  # Seconds between progress bar updates
+PART_STATE_SAVE_INTERVAL = 5.0  # Minimum seconds between .part.json resume-state saves (each is an fsync)
+DOWNLOAD_PREALLOCATE = True  # Reserve the full file size on disk up front when it is known
+
+# Combined download bandwidth for the whole process, in bytes per second ("2M", "500K" or None = unlimited).
+# BANDWIDTH_SCHEDULE entries ("HH:MM", "HH:MM", limit) apply in local time; the first matching one wins.
+# They are checked when the limiter starts; a malformed time or limit raises ValueError.
+# Change it while running with: python main.py bandwidth 2M (or "off"; "auto" returns to the schedule).
+BANDWIDTH_LIMIT = None
+BANDWIDTH_SCHEDULE = [
+    # ("08:00", "18:00", "2M"),  # Leave room on the office uplink during the day
+]
+BANDWIDTH_CHECK_SECONDS = 5.0  # How often the schedule and override file are re-read
+BANDWIDTH_BURST_SECONDS = 1.0  # Unused budget saved up for bursts, in seconds of the limit
+
+# Mirrors: every preferred server's link is kept, probed with a small Range request, and the fastest is used.
+# A download moves to the next mirror (resuming at the same byte) when it is too slow or keeps failing.
+MIRROR_PROBE_BYTES = 256 * 1024  # Size of the probe request used to rank mirrors
+MIRROR_MIN_THROUGHPUT = 512 * 1024  # Bytes per second per connection below which another mirror is tried
+MIRROR_SLOW_WINDOW = 15.0  # Seconds the throughput is measured over before a transfer counts as slow
+MIRROR_MAX_ERRORS = 2  # Consecutive errors on one mirror before switching to the next
+MIRROR_OVERLAP_CHECK = 64 * 1024  # Bytes re-fetched from a new mirror and compared before resuming on it
+
+# Shared HTTP client (http_client.py) used by every module
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+HTTP_TIMEOUT = (10, 60)  # (connect, read) seconds, applied when a request does not set its own
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5  # Exponential backoff between retries: 0.5s, 1s, 2s...
+DEFAULT_HTTP_POOL_SIZE = AIMD_MAX_CONCURRENCY  # Keep-alive connections kept per host (enough for the AIMD ceiling)
+HTTP_POOL_SIZES = {
+    "www3.animefenix.tv": 16,  # Page fetches, searches and redirects all go here
+}
+
+# Local state (caches, databases) lives here
+APP_DATA_DIR = os.environ.get("ANIMESCRAPER_HOME") or os.path.join(os.path.expanduser("~"), ".animescraper")
+
+# On-disk HTTP response cache for search, episode-list and download pages
+HTTP_CACHE_DIR = os.path.join(APP_DATA_DIR, "http_cache")
+HTTP_CACHE_MAX_BYTES = 200 * 1024 * 1024
+HTTP_CACHE_ENABLED = not os.environ.get("ANIMESCRAPER_NO_CACHE")  # Set ANIMESCRAPER_NO_CACHE=1 to bypass
+HTTP_CACHE_TTLS = {  # Seconds an entry is served without revalidation
+    "search": 6 * 3600,
+    "episodes": 3600,  # Airing shows gain episodes, keep this short
+    "download_page": 24 * 3600,
+    "catalog": 0,  # sync-catalog always revalidates (conditional GET) so it sees every new title
+    "default": 0,
+}
+
+# SQLite store of resolved final download URLs per (anime slug, episode, server)
+RESOLVED_URL_DB = os.path.join(APP_DATA_DIR, "resolved_urls.sqlite3")
+RESOLVED_URL_TTL = 12 * 3600  # Mirror links expire; re-resolve after this many seconds
+
+BANDWIDTH_OVERRIDE_FILE = os.path.join(APP_DATA_DIR, "bandwidth_limit")  # Written by `main.py bandwidth`
+
+# Login cookies saved between runs (owner-only permissions) and the page used to check they still work
+COOKIE_JAR_PATH = os.path.join(APP_DATA_DIR, "cookies.json")
+SESSION_CHECK_URL = f"{BASE_URL}/user/profile"  # Redirects to LOGIN_URL when the session has expired
+
+# ChromeDriver lookup: CHROMEDRIVER_PATH env var, this cached path, chromedriver on PATH, then webdriver_manager
+CHROMEDRIVER_PATH_CACHE = os.path.join(APP_DATA_DIR, "chromedriver_path.txt")
+CHROMEDRIVER_CACHE_TTL = 7 * 24 * 3600  # Re-run webdriver_manager's version check after this many seconds
+
+# Integrity and deduplication of downloaded files
+HASH_BLOCK_SIZE = 4 * 1024 * 1024  # Files are hashed as sha256 over the sha256 of each block of this size
+MANIFEST_NAME = ".animescraper-manifest.json"  # Per-directory record of digests, sizes and sources
+LIBRARY_DB = os.path.join(APP_DATA_DIR, "library.sqlite3")  # Digest index across all download directories
+DEDUP_MODE = "auto"  # "auto" (reflink, else hard link), "reflink", "hardlink" or "off"
+
+# BeautifulSoup backend: None picks lxml when installed, otherwise "html.parser"
+HTML_PARSER = None
+
+# Run report: timers and counters are summarized at the end of each run and written to this file
+METRICS_JSON_PATH = "run_metrics.json"
+# Set ANIMESCRAPER_METRICS_PORT to expose Prometheus metrics at http://127.0.0.1:<port>/metrics during long jobs
+METRICS_PROMETHEUS_PORT = int(os.environ.get("ANIMESCRAPER_METRICS_PORT", 0)) or None
+
+# Search pagination: result pages fetched ahead of the consumer, and a hard cap on pages per search
+SEARCH_PREFETCH_PAGES = 3
+SEARCH_MAX_PAGES = 50
+
+# Status codes accepted by the search filters
+STATUS_NAMES = {"1": "Emisión", "2": "Finalizado", "3": "Proximamente", "4": "En Cuarentena"}
+
+# Local full-text catalog of the /animes listing (python main.py sync-catalog)
+CATALOG_DB = os.path.join(APP_DATA_DIR, "catalog.sqlite3")
+CATALOG_ORDER = "added"  # Listing order crawled by the sync: newest-first, so new entries are on the first pages
+CATALOG_NEWEST_FIRST_ORDERS = ("added", "updated")  # Orders that allow an incremental sync to stop early
+CATALOG_FETCH_BATCH = 8  # Listing pages fetched concurrently per batch
+CATALOG_STOP_AFTER_UNCHANGED = 3  # Incremental sync stops after this many pages with nothing new
+CATALOG_FETCH_GENRES = True  # Also fetch each new anime's page to index its genres
+CATALOG_PARSE_PROCESSES = None  # Parser processes (None = one per CPU core)
+CATALOG_SEARCH_LIMIT = 1000  # Most matches returned by one catalog search
+
+# Headless batch mode (python main.py batch jobs.json)
+BATCH_MAX_CONCURRENCY = 6  # Episodes resolved at once across every series in the job file
+BATCH_USERNAME_ENV = "ANIMEFENIX_USERNAME"  # Optional login for batch runs, read from the environment
+BATCH_PASSWORD_ENV = "ANIMEFENIX_PASSWORD"
+
+# Shared work queue (python main.py queue add / worker): put the database on a NAS share to spread one
+# backlog across several hosts. Set ANIMESCRAPER_QUEUE_DB to point every worker at the same file.
+WORK_QUEUE_DB = os.environ.get("ANIMESCRAPER_QUEUE_DB") or os.path.join(APP_DATA_DIR, "work_queue.sqlite3")
+WORK_QUEUE_JOURNAL_MODE = "DELETE"  # WAL is faster but only works when every worker runs on the same host
+WORK_QUEUE_LEASE_SECONDS = 300  # A job is handed to another worker when its lease is not renewed for this long
+WORK_QUEUE_HEARTBEAT_SECONDS = 60  # How often a worker renews the leases it holds
+WORK_QUEUE_MAX_ATTEMPTS = 4  # Attempts per episode before it is marked failed
+WORK_QUEUE_RETRY_DELAY = 60  # Seconds before a failed episode is retried; doubles with each attempt
+WORK_QUEUE_POLL_SECONDS = 10  # Idle wait between claims while other workers still hold jobs
+
+# Logging: records go through a queue to a background writer, so logging never blocks a worker on disk
+LOG_FILE = "scraper_debug.log"
+LOG_LEVEL = "DEBUG"
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotate the log file at this size; each run also starts a fresh file
+LOG_BACKUP_COUNT = 3  # Rotated files kept (scraper_debug.log.1 ... .3)
+LOG_REPEAT_LIMIT = 50  # Records allowed from one logging call per window; the rest are counted and dropped
+LOG_REPEAT_WINDOW = 10.0  # Seconds (normal progress stays well under 5 records a second per call)
+# Large payloads such as page source are written to separate files only when this is on
+DEBUG_DUMPS = bool(os.environ.get("ANIMESCRAPER_DEBUG_DUMPS"))  # Or run with --debug-dumps
+DEBUG_DUMP_DIR = os.path.join(APP_DATA_DIR, "debug_dumps")
+DEBUG_DUMP_MAX_BYTES = 512 * 1024  # Each dump is cut to this size
+DEBUG_DUMP_MAX_FILES = 50  # Older dumps are deleted
@@ -1,12 +1,37 @@
 import os
+import json
+import time
 import requests
-from tqdm import tqdm
 import logging
+import threading
+from urllib3.exceptions import ProtocolError, ReadTimeoutError, SSLError
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from http_client import get_session
+from metrics import metrics
+from library import BlockHasher, Manifest, combine_blocks, content_digest, get_library_index, link_file
+from mirrors import SlowTransferError, rank_mirrors
+from rate_limiter import get_bandwidth_limiter
+from config import (
+    SERVER_SEGMENTS, SEGMENT_MIN_SIZE, SEGMENT_RETRIES, DOWNLOAD_WORKERS, DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_PROGRESS_INTERVAL, DOWNLOAD_PREALLOCATE, HASH_BLOCK_SIZE, MIRROR_MIN_THROUGHPUT, MIRROR_SLOW_WINDOW,
+    MIRROR_MAX_ERRORS, MIRROR_OVERLAP_CHECK, PART_STATE_SAVE_INTERVAL,
+)
 
 class Downloader:
-    def download_file(self, download_url, output_dir, anime_name, episode_number=None, retries=3):
-        """Download a file from the given URL to the specified output directory."""
+    def __init__(self, session=None, url_cache=None, library=None, bandwidth=None):
+        self.session = session or get_session()  # Pooled keep-alive connections shared with the scrapers
+        self.url_cache = url_cache  # Resolved URL store to invalidate when a mirror link goes bad
+        self.library = library or get_library_index()  # Digests of every downloaded file, for deduplication
+        self.bandwidth = bandwidth or get_bandwidth_limiter()  # Byte budget shared by every download
+
+    def download_file(self, download_url, output_dir, anime_name, episode_number=None, retries=3, server=None,
+                      mirrors=None):
+        """Download a file from the given URL to the specified output directory.
+
+        `server` selects the number of parallel segments from config.SERVER_SEGMENTS. `mirrors` lists every
+        (server, url) serving the same file; they are probed, the fastest is used and the others take over
+        (resuming at the same byte) when it turns slow or keeps failing.
+        """
         # Extract file name from the URL
         file_name = os.path.basename(download_url)
 
@@ -17,53 +42,604 @@ class Downloader:
 
         file_path = os.path.join(output_dir, file_name)
 
-        # Skip download if the file already exists
+        manifest = Manifest(output_dir)
+        entry = manifest.get(file_name)
+
+        # Skip download if the file already exists (partial downloads live in .part files, so this is complete)
         if os.path.exists(file_path):
-            logging.info(f"File already exists, skipping: {file_name}")
-            return file_path
+            if entry and entry.get("size") != os.path.getsize(file_path):
+                logging.warning(f"{file_name} does not match its manifest size, downloading it again")
+                os.remove(file_path)
+            else:
+                logging.info(f"File already exists, skipping: {file_name}")
+                metrics.inc("downloads_total", result="skipped")
+                return file_path
 
-        # Attempt to download the file
-        try:
-            response = requests.get(download_url, stream=True)
-            response.raise_for_status()  # Raise error for bad responses
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        # A file we downloaded before (then deleted or moved) may still exist elsewhere in the library
+        if entry and entry.get("digest"):
+            existing = self.library.find(entry["digest"], entry["size"], exclude=file_path)
+            if existing and link_file(existing, file_path):
+                logging.info(f"Restored {file_name} from identical file {existing} without downloading")
+                metrics.inc("downloads_total", result="linked")
+                return file_path
+
+        part_path = file_path + ".part"
+        candidates = list(mirrors or [(server, download_url)])
+        sources = {url for _, url in candidates}  # Any of these may continue a .part file left by another
+        if len(candidates) > 1:
+            candidates = rank_mirrors(self.session, candidates)
+        slow = set()  # Mirrors that fell below MIRROR_MIN_THROUGHPUT
+        errors = 0  # Consecutive failed attempts on the current mirror
+        attempt = 0
+        with metrics.timer("download_seconds", server=candidates[0][0] or "unknown"):
+            while attempt <= retries and candidates:
+                server, download_url = candidates[0]
+                segment_count = SERVER_SEGMENTS.get(server, 1)
+                # Slow transfers only matter while a mirror that has not been slow yet is left to try
+                min_rate = MIRROR_MIN_THROUGHPUT if any(mirror not in slow for mirror in candidates[1:]) else None
+                # Attempt to download (or resume) the file
+                try:
+                    probe = self._probe_ranges(download_url) if segment_count > 1 else None
+                    if probe:
+                        complete = self._download_segmented(download_url, part_path, file_name, segment_count, *probe,
+                                                            sources=sources, min_rate=min_rate)
+                    else:
+                        complete = self._download_to_part(download_url, part_path, file_name, sources=sources,
+                                                          min_rate=min_rate)
+                    if complete:
+                        # Hashed while writing; only .part files left by older versions need to be read again
+                        digest = (self._load_part_state(part_path) or {}).get("digest") or content_digest(part_path)
+                        os.replace(part_path, file_path)  # Atomic: the final name only ever holds complete files
+                        self._remove_part_state(part_path)
+                        logging.info(f"File downloaded successfully: {file_path}")
+                        metrics.inc("downloads_total", result="ok")
+                        self._register(manifest, file_path, digest, download_url, server)
+                        return file_path
+                    logging.warning(f"Incomplete download for {file_name}, resuming...")
+
+                except SlowTransferError as se:
+                    logging.warning(f"{server} is too slow for {file_name} ({se}), switching mirror")
+                    slow.add(candidates[0])
+                    self._switch_mirror(candidates, "slow")
+                    errors = 0
+                    continue  # Not a failure of the file itself, so it does not use up a retry
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as ce:
+                    logging.error(f"Connection error while downloading {file_name}. Error: {ce}")
+                except requests.Timeout as te:
+                    logging.error(f"Timeout error while downloading {file_name}. Error: {te}")
+                except requests.HTTPError as he:
+                    status_code = he.response.status_code if he.response is not None else None
+                    logging.error(f"HTTP error {status_code} while downloading {file_name}. Error: {he}")
+                    if self.url_cache and status_code in (403, 404):
+                        self.url_cache.invalidate_url(download_url)  # Expired or removed link: resolve again next run
+                    # This mirror will not serve the file; the next one may
+                    candidates.pop(0)
+                    if candidates:
+                        metrics.inc("mirror_switches_total", reason="http_error")
+                        logging.info(f"Trying {file_name} on {candidates[0][0]} instead")
+                    continue
+
+                attempt += 1
+                errors += 1
+                if attempt <= retries:
+                    metrics.inc("download_retries_total")
+                if errors >= MIRROR_MAX_ERRORS and len(candidates) > 1:
+                    logging.warning(f"{server} failed {errors} times in a row for {file_name}, switching mirror")
+                    self._switch_mirror(candidates, "errors")
+                    errors = 0
+
+            reason = f"after {attempt} failed attempts" if candidates else "no mirror left to try"
+            logging.error(f"Giving up on {file_name} {reason}; partial data kept in {part_path}")
+            metrics.inc("downloads_total", result="failed")
+            return None
+
+    def _switch_mirror(self, candidates, reason):
+        """Moves the current mirror to the back of the list; the next download attempt resumes on the new first."""
+        candidates.append(candidates.pop(0))
+        metrics.inc("mirror_switches_total", reason=reason)
+        logging.info(f"Continuing on mirror {candidates[0][0]}: {candidates[0][1]}")
+
+    def _register(self, manifest, file_path, digest, download_url, server):
+        """Records the file in its directory manifest and replaces it with a link if identical data exists."""
+        size = os.path.getsize(file_path)
+        duplicate = self.library.find(digest, size, exclude=file_path)
+        method = link_file(duplicate, file_path) if duplicate else None
+        if method:
+            logging.info(f"{os.path.basename(file_path)} is identical to {duplicate}; stored once via {method}")
+            metrics.inc("dedup_bytes_saved_total", size)
+        manifest.record(os.path.basename(file_path), digest=digest, size=size, url=download_url, server=server,
+                        linked_to=duplicate if method else None)
+        self.library.add(file_path, digest, size)
+
+    def _download_to_part(self, download_url, part_path, file_name, sources=(), min_rate=None):
+        """Downloads into the .part file, resuming from its current size when possible. Returns True when complete.
 
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
+        A .part file started from another URL in `sources` (a mirror of the same file) is resumed only after the
+        bytes just before the offset, fetched again from this URL, match what is already on disk.
+        """
+        state = self._load_part_state(part_path)
+        if state and state.get("segments"):
+            state = self._join_segments(state)  # Started segmented, e.g. on a mirror that allows more connections
+        offset = 0
+        overlap = 0
+        headers = {}
+        same_source = bool(state) and state.get("url") == download_url
+        if state and (same_source or state.get("url") in sources) and os.path.exists(part_path):
+            if state.get("digest"):
+                return True  # Finished earlier but was not renamed yet
+            # .part files are preallocated, so progress comes from the sidecar; resuming at a block boundary
+            # keeps the in-stream hash exact. Older .part files only grew as they were written.
+            offset = min(state.get("done", os.path.getsize(part_path)), os.path.getsize(part_path))
+            if "blocks" in state:
+                offset = min(offset, len(state["blocks"]) * HASH_BLOCK_SIZE)
+            elif state.get("size") and offset >= state["size"]:
+                return True
+            if offset and same_source:
+                headers['Range'] = f"bytes={offset}-"
+                # Only resume if the remote file is unchanged, otherwise the server sends the whole file
+                validator = state.get("etag") or state.get("last_modified")
+                if validator:
+                    headers['If-Range'] = validator
+            elif offset:
+                # Validators differ between hosts; compare the bytes themselves instead
+                overlap = min(MIRROR_OVERLAP_CHECK, offset)
+                headers['Range'] = f"bytes={offset - overlap}-"
 
+        response = self.session.get(download_url, stream=True, headers=headers)
+        response.raise_for_status()  # Raise error for bad responses
+
+        if overlap and response.status_code == 206 and not self._continues_part(response, part_path, offset - overlap,
+                                                                                 overlap, state.get("size")):
+            logging.info(f"{file_name} on this mirror does not match the partial data, starting over")
+            response.close()
+            offset = 0
+            response = self.session.get(download_url, stream=True)
+            response.raise_for_status()
+
+        if offset and response.status_code == 206:
+            logging.info(f"Resuming {file_name} from byte {offset}")
+            mode = 'r+b'
+            total_size = offset - overlap + int(response.headers.get('content-length', 0))
+            # Without recorded block digests the file is hashed after it completes instead
+            hasher = BlockHasher(state["blocks"][:offset // HASH_BLOCK_SIZE]) if "blocks" in state else None
+        else:
+            if offset:
+                logging.info(f"Server does not support resuming {file_name}, starting over")
+            offset = 0
+            mode = 'wb'
             total_size = int(response.headers.get('content-length', 0))
-            with open(file_path, 'wb') as file:
+            hasher = BlockHasher()
+
+        # Record what the .part file belongs to before writing any data into it
+        state = {
+            "url": download_url,
+            "size": total_size or (state or {}).get("size"),
+            "etag": response.headers.get('ETag'),
+            "last_modified": response.headers.get('Last-Modified'),
+            "done": offset,
+        }
+        if hasher:
+            state["blocks"] = list(hasher.blocks)
+        self._save_part_state(part_path, state)
+
+        from tqdm import tqdm
+        written = 0
+        saved = [time.monotonic(), offset]
+        try:
+            with open(part_path, mode) as file:
+                if mode == 'wb':
+                    self._preallocate(file.fileno(), total_size)
+                else:
+                    file.seek(offset)
                 # Use tqdm for progress indication if total size is known
                 with tqdm(
                     desc=file_name,
                     total=total_size if total_size else None,
+                    initial=offset,
                     unit='B',
                     unit_scale=True,
                     unit_divisor=1024,
+                    mininterval=DOWNLOAD_PROGRESS_INTERVAL,
                 ) as bar:
-                    for data in response.iter_content(chunk_size=1024):
+                    def write(data):
                         file.write(data)
-                        bar.update(len(data))
+                        if hasher:
+                            hasher.update(data)
+
+                    def progress(count):
+                        nonlocal written
+                        written += count
+                        bar.update(count)
+                        state["done"] = offset + written
+                        if self._state_save_due(saved, state["done"]):
+                            # Bytes reach the file before they are recorded, so a resume never skips data
+                            file.flush()
+                            if hasher:
+                                state["blocks"] = list(hasher.blocks)
+                            self._save_part_state(part_path, state)
+
+                    try:
+                        self._copy_body(response, write, progress, min_rate)
+                    finally:
+                        # Record where this attempt stopped so a retry or the next mirror continues from there
+                        file.flush()
+                        if hasher:
+                            state["blocks"] = list(hasher.blocks)
+                        self._save_part_state(part_path, state)
+        finally:
+            metrics.inc("download_bytes_total", written)
+
+        # Check if the download was incomplete
+        complete = not total_size or offset + written >= total_size
+        if complete and hasher:
+            state["digest"] = combine_blocks(hasher.finish())
+            self._save_part_state(part_path, state)
+        return complete
+
+    def _continues_part(self, response, part_path, start, length, size):
+        """Reads `length` re-fetched bytes at the head of a 206 response and checks they equal the .part file's."""
+        content_range = response.headers.get('Content-Range', '')
+        if (response.headers.get('Content-Encoding', 'identity').lower() not in ('identity', '')
+                or not content_range.startswith(f"bytes {start}-")
+                or (size and content_range.rpartition('/')[2] != str(size))):
+            return False
+        with open(part_path, 'rb') as file:
+            file.seek(start)
+            expected = file.read(length)
+        received = b""
+        while len(received) < len(expected):
+            data = response.raw.read(len(expected) - len(received))
+            if not data:
+                break
+            received += data
+        return received == expected
+
+    def _segments_match(self, download_url, part_path, segments, total_size):
+        """Re-fetches the bytes before each resumed segment's offset from another mirror and compares them.
+
+        Validators differ between hosts, so this is what tells a mirror of the same file from another encode.
+        """
+        for start, _, done, *_ in segments:
+            overlap = min(MIRROR_OVERLAP_CHECK, done)
+            if not overlap:
+                continue
+            position = start + done
+            headers = {'Range': f"bytes={position - overlap}-{position - 1}"}
+            with self.session.get(download_url, stream=True, headers=headers) as response:
+                response.raise_for_status()
+                if response.status_code != 206 or not self._continues_part(response, part_path, position - overlap,
+                                                                            overlap, total_size):
+                    return False
+        return True
+
+    def _probe_ranges(self, download_url):
+        """Checks whether the server supports byte ranges. Returns (total_size, validator) or None."""
+        response = self.session.get(download_url, stream=True, headers={'Range': 'bytes=0-0'})
+        response.close()
+        if response.status_code != 206:
+            return None
+        # Content-Range looks like "bytes 0-0/123456"
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        if not total.isdigit() or int(total) < SEGMENT_MIN_SIZE:
+            return None
+        return int(total), response.headers.get('ETag') or response.headers.get('Last-Modified')
+
+    def _download_segmented(self, download_url, part_path, file_name, segment_count, total_size, validator,
+                            sources=(), min_rate=None):
+        """Fetches byte ranges in parallel into a preallocated .part file. Returns True when every segment is done.
 
-            # Check if the download was incomplete
-            if total_size and os.path.getsize(file_path) < total_size and retries > 0:
-                logging.warning(f"Incomplete download for {file_name}, retrying...")
-                return self.download_file(download_url, output_dir, anime_name, episode_number, retries - 1)
+        Progress made from another URL in `sources` carries over when the total size is the same.
+        """
+        state = self._load_part_state(part_path)
+        segments = None
+        if (state and (state.get("url") == download_url or state.get("url") in sources)
+                and state.get("size") == total_size and os.path.exists(part_path)):
+            # A single-stream .part (e.g. from a mirror that allows one connection) continues as segments
+            segments = state.get("segments") or self._split_progress(state, segment_count, total_size)
+        if segments:
+            # Segments written by older versions carry no block digests; those files are hashed after completion
+            if all(len(segment) > 3 for segment in segments):
+                for segment in segments:
+                    segment[2] = min(segment[2], len(segment[3]) * HASH_BLOCK_SIZE)
+            if state["url"] != download_url and not self._segments_match(download_url, part_path, segments, total_size):
+                logging.info(f"{file_name} on this mirror does not match the partial data, starting over")
+                segments = None
+        if segments:
+            logging.info(f"Resuming segmented download of {file_name}")
+        else:
+            segments = self._segment_layout(total_size, segment_count)
+            with open(part_path, 'wb') as file:
+                self._preallocate(file.fileno(), total_size)
+        state = {"url": download_url, "size": total_size, "etag": validator, "segments": segments}
+        self._save_part_state(part_path, state)
+
+        hashable = all(len(segment) > 3 for segment in segments)
+
+        from tqdm import tqdm
+        state_lock = threading.Lock()
+        done = sum(segment[2] for segment in segments)
+        pending = [segment for segment in segments if segment[0] + segment[2] <= segment[1]]
+        # The slowness threshold is per connection, and the segments share the mirror's bandwidth
+        segment_rate = min_rate / len(pending) if min_rate and pending else None
+        slow_error = None
+        saved = [time.monotonic(), done]
+
+        def checkpoint():
+            # Called with state_lock held, after the segment's bytes went to the file (pwrite is unbuffered)
+            if self._state_save_due(saved, sum(segment[2] for segment in segments)):
+                self._save_part_state(part_path, state)
+
+        with tqdm(
+            desc=file_name,
+            total=total_size,
+            initial=done,
+            unit='B',
+            unit_scale=True,
+            unit_divisor=1024,
+            mininterval=DOWNLOAD_PROGRESS_INTERVAL,
+        ) as bar:
+            with ThreadPoolExecutor(max_workers=len(pending) or 1) as executor:
+                futures = [
+                    executor.submit(self._download_segment, download_url, part_path, segment, validator, bar, state_lock,
+                                    min_rate=segment_rate, checkpoint=checkpoint)
+                    for segment in pending
+                ]
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except SlowTransferError as e:
+                        slow_error = e
+                    except Exception as e:
+                        logging.error(f"Segment of {file_name} failed: {e}")
+                    with state_lock:
+                        self._save_part_state(part_path, state)
+
+        complete = all(segment[0] + segment[2] > segment[1] for segment in segments)
+        if not complete and slow_error:
+            raise slow_error
+        if complete and hashable:
+            state["digest"] = combine_blocks([block for segment in segments for block in segment[3]])
+            self._save_part_state(part_path, state)
+        return complete
+
+    def _segment_layout(self, total_size, segment_count):
+        """Splits the file into [start, end, bytes_done, block_digests] ranges, none of them started yet.
+
+        Segments start on hash block boundaries so each one can hash its own blocks while writing.
+        """
+        segment_size = -(-total_size // segment_count)
+        segment_size = -(-segment_size // HASH_BLOCK_SIZE) * HASH_BLOCK_SIZE
+        return [[start, min(start + segment_size, total_size) - 1, 0, []] for start in range(0, total_size, segment_size)]
+
+    def _split_progress(self, state, segment_count, total_size):
+        """Lays the contiguous progress of a single-stream .part out as segments. Returns None if there is none."""
+        blocks = state.get("blocks")
+        done = state.get("done", 0)
+        if blocks is not None:
+            done = min(done, len(blocks) * HASH_BLOCK_SIZE)  # Resume at a block boundary to keep the hash exact
+        if not done:
+            return None
+        segments = self._segment_layout(total_size, segment_count)
+        for segment in segments:
+            segment[2] = max(0, min(done - segment[0], segment[1] - segment[0] + 1))
+            if blocks is None:
+                del segment[3:]  # No block digests recorded: the file is hashed after it completes
+            else:
+                segment[3] = blocks[segment[0] // HASH_BLOCK_SIZE:(segment[0] + segment[2]) // HASH_BLOCK_SIZE]
+        return segments
+
+    def _join_segments(self, state):
+        """Turns the state of a segmented .part into single-stream progress: the completed prefix of its segments."""
+        segments = sorted(state["segments"])
+        hashable = all(len(segment) > 3 for segment in segments)
+        done = 0
+        blocks = []
+        for segment in segments:
+            if segment[0] != done:
+                break
+            count = segment[2]
+            if hashable:
+                count = min(count, len(segment[3]) * HASH_BLOCK_SIZE)
+                blocks += segment[3][:count // HASH_BLOCK_SIZE]
+            done = segment[0] + count
+            if done <= segment[1]:
+                break  # This segment is unfinished; whatever follows it is not contiguous
+        joined = {"url": state.get("url"), "size": state.get("size"), "etag": state.get("etag"), "done": done}
+        if hashable:
+            joined["blocks"] = blocks
+        if state.get("digest"):
+            joined["digest"] = state["digest"]  # Finished earlier but was not renamed yet
+        return joined
+
+    def _download_segment(self, download_url, part_path, segment, validator, bar, state_lock, retries=SEGMENT_RETRIES,
+                          min_rate=None, checkpoint=None):
+        """Downloads one [start, end, bytes_done, block_digests] range, retrying on its own from where it stopped.
+
+        `checkpoint()` is called under `state_lock` after each progress update so the sidecar can record it.
+        """
+        start, end = segment[0], segment[1]
+        hasher = BlockHasher(segment[3]) if len(segment) > 3 else None
+        fd = os.open(part_path, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            for attempt in range(retries + 1):
+                if hasher:
+                    # Restart at the last complete hash block so the digest covers every byte exactly once
+                    with state_lock:
+                        hasher.reset_partial()
+                        bar.update(hasher.hashed_bytes - segment[2])
+                        segment[2] = hasher.hashed_bytes
+                position = attempt_start = start + segment[2]
+                if position > end:
+                    return
+                if attempt:
+                    metrics.inc("segment_retries_total")
+                headers = {'Range': f"bytes={position}-{end}"}
+                if validator:
+                    headers['If-Range'] = validator
+                try:
+                    response = self.session.get(download_url, stream=True, headers=headers)
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise requests.HTTPError("Server stopped honoring byte ranges", response=response)
+                    def write(data):
+                        nonlocal position
+                        self._write_at(fd, data, position)
+                        position += len(data)
+                        if hasher:
+                            hasher.update(data)
+
+                    def progress(count):
+                        with state_lock:
+                            segment[2] += count
+                            bar.update(count)
+                            if hasher:
+                                segment[3] = list(hasher.blocks)
+                            if checkpoint:
+                                checkpoint()
+
+                    self._copy_body(response, write, progress, min_rate)
+                    if position > end:
+                        if hasher:
+                            with state_lock:
+                                segment[3] = hasher.finish()
+                        return
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    logging.warning(f"Segment {start}-{end} interrupted at byte {position} (attempt {attempt + 1}): {e}")
+                except SlowTransferError:
+                    if hasher:
+                        # Drop the unfinished block like a retry would, so the next mirror restarts it cleanly
+                        with state_lock:
+                            hasher.reset_partial()
+                            bar.update(hasher.hashed_bytes - segment[2])
+                            segment[2] = hasher.hashed_bytes
+                    raise
+                finally:
+                    metrics.inc("download_bytes_total", position - attempt_start)
+            if start + segment[2] <= end:
+                raise IOError(f"Segment {start}-{end} incomplete after {retries + 1} attempts")
+        finally:
+            os.close(fd)
+
+    def _copy_body(self, response, write, progress, min_rate=None):
+        """Streams the response body to `write` through one reused buffer.
+
+        `progress(byte_count)` is called at most every DOWNLOAD_PROGRESS_INTERVAL seconds and once at the end,
+        even when the transfer fails, so callers always account for every byte written. With `min_rate`,
+        SlowTransferError is raised when a MIRROR_SLOW_WINDOW stretch averages fewer bytes per second.
+        """
+        buffer = bytearray(DOWNLOAD_CHUNK_SIZE)
+        view = memoryview(buffer)
+        # Compressed bodies have to go through requests' decoder; media files are sent as-is
+        encoded = response.headers.get('Content-Encoding', 'identity').lower() not in ('identity', '')
+        chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE) if encoded else None
+        pending = 0
+        last_report = window_start = time.monotonic()
+        window_bytes = 0
+        try:
+            while True:
+                if chunks is not None:
+                    data = next(chunks, b'')
+                else:
+                    count = response.raw.readinto(buffer)
+                    data = view[:count]
+                if not data:
+                    break
+                write(data)
+                pending += len(data)
+                # Time spent waiting for the global bandwidth budget is not the mirror's fault
+                window_start += self.bandwidth.consume(len(data))
+                now = time.monotonic()
+                if now - last_report >= DOWNLOAD_PROGRESS_INTERVAL:
+                    progress(pending)
+                    pending = 0
+                    last_report = now
+                if min_rate:
+                    window_bytes += len(data)
+                    if now - window_start >= MIRROR_SLOW_WINDOW:
+                        rate = window_bytes / (now - window_start)
+                        if rate < min_rate:
+                            raise SlowTransferError(f"{rate / 1024:.0f} KiB/s over {now - window_start:.0f}s")
+                        window_start, window_bytes = now, 0
+        # Same translation iter_content does, so callers keep catching requests' exceptions
+        except ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except ReadTimeoutError as e:
+            raise requests.ConnectionError(e)
+        except SSLError as e:
+            raise requests.exceptions.SSLError(e)
+        finally:
+            if pending:
+                progress(pending)
+
+    def _preallocate(self, fd, size):
+        """Reserves `size` bytes for the file so it is not fragmented while it grows."""
+        if not size:
+            return
+        if DOWNLOAD_PREALLOCATE and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError:
+                pass  # Filesystem without fallocate support
+        os.ftruncate(fd, size)
+
+    def _write_at(self, fd, data, position):
+        """Positioned write that does not move a shared file offset."""
+        if hasattr(os, 'pwrite'):
+            os.pwrite(fd, data, position)
+        else:
+            # Windows has no pwrite; each segment owns its descriptor, so seek + write is safe
+            os.lseek(fd, position, os.SEEK_SET)
+            os.write(fd, data)
+
+    def _state_save_due(self, saved, done):
+        """Whether the progress since the last sidecar save (`saved` = [time, bytes_done]) is worth an fsync.
+
+        Resumes restart at a hash block boundary anyway, so the sidecar is rewritten only once another block's
+        worth of data arrived, and at most every PART_STATE_SAVE_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if now - saved[0] < PART_STATE_SAVE_INTERVAL or done - saved[1] < HASH_BLOCK_SIZE:
+            return False
+        saved[:] = [now, done]
+        return True
+
+    def _part_state_path(self, part_path):
+        return part_path + ".json"
+
+    def _load_part_state(self, part_path):
+        """Reads the sidecar describing a .part file (URL, expected size and validators)."""
+        try:
+            with open(self._part_state_path(part_path), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
 
-            logging.info(f"File downloaded successfully: {file_path}")
-            return file_path
+    def _save_part_state(self, part_path, state):
+        """Replaces the sidecar atomically, so a crash mid-write never leaves a truncated one behind."""
+        state_path = self._part_state_path(part_path)
+        temp_path = f"{state_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, state_path)
 
-        except requests.ConnectionError as ce:
-            logging.error(f"Connection error while downloading {file_name}. Error: {ce}")
-        except requests.Timeout as te:
-            logging.error(f"Timeout error while downloading {file_name}. Error: {te}")
-        except requests.HTTPError as he:
-            logging.error(f"HTTP error {response.status_code} while downloading {file_name}. Error: {he}")
-        
+    def _remove_part_state(self, part_path):
+        for path in (self._part_state_path(part_path), f"{self._part_state_path(part_path)}.tmp"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
     def download_files(self, download_urls, output_dir, anime_name):
         """Download multiple files concurrently."""
         results = []
-        with ThreadPoolExecutor(max_workers=5) as executor:  # Adjust max_workers as needed
+        # Upper bound only: requests to each host wait for a slot from that host's AIMD controller
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
             future_to_url = {executor.submit(self.download_file, url, output_dir, anime_name): url for url in download_urls}
             for future in as_completed(future_to_url):
                 url = future_to_url[future]
@@ -0,0 +1,127 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from browser import create_driver
+from config import DRIVER_POOL_SIZE, DRIVER_MAX_USES, HEADLESS_BROWSER, RESOLVER_BROWSER_PROFILE
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        """Wrap a WebDriver with the bookkeeping the pool needs."""
+        self.driver = driver
+        self.uses = 0
+
+
+class DriverPool:
+    def __init__(self, size=DRIVER_POOL_SIZE, max_uses=DRIVER_MAX_USES, headless=HEADLESS_BROWSER,
+                 profile=RESOLVER_BROWSER_PROFILE):
+        """Pool of up to `size` Chrome instances, each recycled after `max_uses` checkouts."""
+        self.size = size
+        self.max_uses = max_uses
+        self.headless = headless
+        self.profile = profile  # browser.LEAN_PROFILE or FULL_PROFILE
+        self.idle = queue.LifoQueue()  # Reuse the most recently returned (warm) driver first
+        self.slots = threading.BoundedSemaphore(size)  # Caps the number of live drivers
+        self.lock = threading.Lock()
+        self.all_drivers = set()
+        self.closed = False
+
+    def _create(self):
+        pooled = PooledDriver(create_driver(headless=self.headless, profile=self.profile))
+        with self.lock:
+            self.all_drivers.add(pooled)
+        logging.info(f"Started pooled WebDriver ({len(self.all_drivers)}/{self.size})")
+        return pooled
+
+    def _destroy(self, pooled):
+        with self.lock:
+            self.all_drivers.discard(pooled)
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logging.warning(f"Error while closing pooled WebDriver: {e}")
+
+    def _is_healthy(self, pooled):
+        """Checks that the browser still responds to commands."""
+        try:
+            pooled.driver.current_window_handle
+            return True
+        except Exception as e:
+            logging.warning(f"Pooled WebDriver failed health check: {e}")
+            return False
+
+    def _reset(self, pooled):
+        """Closes the extra tabs opened by redirects so the next user starts clean."""
+        driver = pooled.driver
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.get("about:blank")
+
+    def checkout(self):
+        """Takes a healthy driver from the pool, starting a new one if none is idle."""
+        if self.closed:
+            raise RuntimeError("DriverPool is closed")
+        self.slots.acquire()
+        try:
+            while True:
+                try:
+                    pooled = self.idle.get_nowait()
+                except queue.Empty:
+                    pooled = self._create()
+                    break
+                if self._is_healthy(pooled):
+                    break
+                self._destroy(pooled)
+            pooled.uses += 1
+            return pooled
+        except Exception:
+            self.slots.release()
+            raise
+
+    def checkin(self, pooled, broken=False):
+        """Returns a driver to the pool, recycling it if it is broken or worn out."""
+        try:
+            if self.closed or broken or pooled.uses >= self.max_uses:
+                self._destroy(pooled)
+                return
+            try:
+                self._reset(pooled)
+            except Exception as e:
+                logging.warning(f"Could not reset pooled WebDriver, recycling it: {e}")
+                self._destroy(pooled)
+                return
+            self.idle.put(pooled)
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def driver(self):
+        """Context manager yielding a WebDriver that is returned to the pool afterwards."""
+        pooled = self.checkout()
+        broken = False
+        try:
+            yield pooled.driver
+        except Exception:
+            broken = not self._is_healthy(pooled)
+            raise
+        finally:
+            self.checkin(pooled, broken=broken)
+
+    def close(self):
+        """Quits every driver owned by the pool."""
+        self.closed = True
+        with self.lock:
+            drivers = list(self.all_drivers)
+        for pooled in drivers:
+            self._destroy(pooled)
+        logging.info("All pooled WebDrivers closed.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,23 +1,33 @@
 import requests
-from bs4 import BeautifulSoup
 import logging
+from html_parser import make_soup, EPISODE_LIST_STRAINER
+from http_cache import get_cache
 
 class EpisodeFetcher:
-    def __init__(self, session):
+    def __init__(self, session, cache=None):
         """Initialize the EpisodeFetcher with a session."""
         self.session = session
+        self.cache = cache or get_cache()
         self.episode_list_selector = 'ul.divide-y'  # Selector for the episode list
         self.episode_item_selector = 'li'  # Selector for episode items
         self.episode_link_selector = 'a'  # Selector for episode links
 
-    def fetch_episode_links(self, anime_name, anime_link):
+    def fetch_episode_links(self, anime_name, anime_link, bypass_cache=False):
         """Fetch episode links for the specified anime."""
         print(f"Fetching episodes for: {anime_link}")  # Debugging statement
         try:
-            response = self.session.get(anime_link)
+            parsed = {}
+
+            def has_episode_list(response):
+                # A bot-check page has no episode list and must not be cached in place of the real page
+                parsed["soup"] = make_soup(response.content, parse_only=EPISODE_LIST_STRAINER)
+                return parsed["soup"].select_one(self.episode_list_selector) is not None
+
+            response = self.cache.get(self.session, anime_link, endpoint="episodes", bypass=bypass_cache,
+                                      validate=has_episode_list)
             response.raise_for_status()  # Raise an error for bad responses
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = parsed["soup"] if "soup" in parsed else make_soup(response.content, parse_only=EPISODE_LIST_STRAINER)
             episode_list = soup.select_one(self.episode_list_selector)
             episode_links = []
             
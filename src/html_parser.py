@@ -0,0 +1,56 @@
+import re
+import logging
+import threading
+from importlib.util import find_spec
+from config import HTML_PARSER
+
+
+def detect_parser():
+    """Picks the fastest BeautifulSoup tree builder available (lxml), falling back to html.parser."""
+    if HTML_PARSER:
+        return HTML_PARSER
+    # find_spec checks that lxml is installed without paying for importing it here
+    return 'lxml' if find_spec('lxml') else 'html.parser'
+
+
+PARSER = detect_parser()
+logging.debug(f"Using HTML parser backend: {PARSER}")
+
+
+def has_class(class_name):
+    """Matches one CSS class inside a multi-class attribute.
+
+    While parsing, the strainer may see the raw "a b c" attribute string instead of a list of classes,
+    so a plain string would only match elements that have exactly that one class.
+    """
+    return re.compile(rf"(^|\s){re.escape(class_name)}(\s|$)")
+
+
+class LazyStrainer:
+    def __init__(self, name=None, **attrs):
+        """SoupStrainer arguments, turned into a real SoupStrainer the first time a page is parsed with them."""
+        self.name = name
+        self.attrs = attrs
+        self.strainer = None
+        self.lock = threading.Lock()
+
+    def build(self):
+        with self.lock:
+            if self.strainer is None:
+                from bs4 import SoupStrainer
+                self.strainer = SoupStrainer(self.name, **self.attrs)
+            return self.strainer
+
+
+# Only the subtrees each scraper reads are built; everything else on the page is skipped while parsing
+SEARCH_RESULTS_STRAINER = LazyStrainer(class_=has_class("overflow-hidden"))  # Anime cards (".group.relative.overflow-hidden")
+EPISODE_LIST_STRAINER = LazyStrainer('ul', class_=has_class('divide-y'))
+DOWNLOAD_LINKS_STRAINER = LazyStrainer('div', class_=has_class('max-w-4xl'))
+
+
+def make_soup(markup, parse_only=None):
+    """Parses `markup` with the preferred backend, optionally restricted to the elements matched by `parse_only`."""
+    from bs4 import BeautifulSoup  # Deferred so commands that never parse HTML start faster
+    if isinstance(parse_only, LazyStrainer):
+        parse_only = parse_only.build()
+    return BeautifulSoup(markup, PARSER, parse_only=parse_only)
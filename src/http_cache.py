@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from config import HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_TTLS, HTTP_CACHE_ENABLED
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+class CachedResponse:
+    def __init__(self, url, content, encoding, status_code=200, from_cache=True):
+        """Minimal stand-in for requests.Response built from a cache entry."""
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.status_code = status_code
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def raise_for_status(self):
+        pass  # Only successful responses are ever cached
+
+
+class HTTPCache:
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, max_bytes=HTTP_CACHE_MAX_BYTES, ttls=None, enabled=HTTP_CACHE_ENABLED):
+        """On-disk HTML cache with per-endpoint TTLs, conditional revalidation and LRU eviction."""
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttls = ttls if ttls is not None else HTTP_CACHE_TTLS
+        self.enabled = enabled  # False bypasses the cache entirely (always hit the network)
+        self.lock = threading.Lock()
+        self.total_bytes = None  # Running size of the cached bodies, counted on the first store
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, url, params=None):
+        """Cache key derived from the URL and its (sorted) query parameters."""
+        raw = url + "?" + json.dumps(params or {}, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".body", base + ".json"
+
+    def _load(self, key):
+        body_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            with open(body_path, 'rb') as file:
+                content = file.read()
+            return meta, content
+        except (OSError, ValueError):
+            return None, None
+
+    def _store(self, key, meta, content):
+        body_path, meta_path = self._paths(key)
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = self._scan()[1]
+            try:
+                self.total_bytes -= os.path.getsize(body_path)  # Replaced entry
+            except OSError:
+                pass
+            # Write to temp files first so a crash never leaves a half-written entry behind
+            with open(body_path + ".tmp", 'wb') as file:
+                file.write(content)
+            with open(meta_path + ".tmp", 'w', encoding='utf-8') as file:
+                json.dump(meta, file)
+            os.replace(body_path + ".tmp", body_path)
+            os.replace(meta_path + ".tmp", meta_path)
+            self.total_bytes += len(content)
+            over = self.total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _store_meta(self, key, meta):
+        """Rewrites only the metadata of an entry whose body is unchanged (after a 304)."""
+        _, meta_path = self._paths(key)
+        with self.lock:
+            with open(meta_path + ".tmp", 'w', encoding='utf-8') as file:
+                json.dump(meta, file)
+            os.replace(meta_path + ".tmp", meta_path)
+        self._touch(key)
+
+    def _touch(self, key):
+        """Marks an entry as recently used for LRU eviction."""
+        body_path, _ = self._paths(key)
+        try:
+            os.utime(body_path, None)
+        except OSError:
+            pass
+
+    def get(self, session, url, params=None, endpoint="default", bypass=False, rate_limiter=None, validate=None):
+        """GETs `url` through the cache. Raises requests exceptions just like session.get + raise_for_status.
+
+        `validate(response)` tells a real page from e.g. a bot-check page served with 200; responses it rejects
+        are returned but not cached.
+        """
+        if bypass or not self.enabled:
+            if rate_limiter:
+                rate_limiter.wait(url)
+            response = session.get(url, params=params)
+            response.raise_for_status()
+            return response
+
+        key = self.make_key(url, params)
+        meta, content = self._load(key)
+        ttl = self.ttls.get(endpoint, self.ttls.get("default", 0))
+        if meta and time.time() - meta["fetched_at"] < ttl:
+            self._touch(key)
+            logging.debug(f"Cache hit for {url}")
+            return CachedResponse(meta["url"], content, meta.get("encoding"))
+
+        # Stale or missing: revalidate with the stored validators if we have them
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers['If-None-Match'] = meta["etag"]
+            if meta.get("last_modified"):
+                headers['If-Modified-Since'] = meta["last_modified"]
+
+        if rate_limiter:
+            rate_limiter.wait(url)
+        response = session.get(url, params=params, headers=headers)
+        if response.status_code == 304 and meta:
+            logging.debug(f"Cache revalidated for {url}")
+            meta["fetched_at"] = time.time()
+            self._store_meta(key, meta)
+            return CachedResponse(meta["url"], content, meta.get("encoding"))
+
+        response.raise_for_status()
+        if validate and not validate(response):
+            logging.debug(f"Not caching {url}: the response did not pass validation")
+            return response
+        self._store(key, {
+            "url": response.url,
+            "fetched_at": time.time(),
+            "etag": response.headers.get('ETag'),
+            "last_modified": response.headers.get('Last-Modified'),
+            "encoding": response.encoding or response.apparent_encoding,
+        }, response.content)
+        return response
+
+    def _scan(self):
+        """Lists the cached bodies. Returns ([(mtime, size, key)], total_bytes)."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".body"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-len(".body")]))
+            total += stat.st_size
+        return entries, total
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes.
+
+        Stores only call this once the running total goes over the limit. The directory is rescanned then,
+        which also picks up entries written by other processes, and trimmed to 90% so the next few stores
+        do not trigger another scan.
+        """
+        with self.lock:
+            entries, total = self._scan()
+            target = self.max_bytes * 0.9
+            if total <= self.max_bytes:
+                self.total_bytes = total
+                return
+            entries.sort()  # Oldest access first
+            for _, size, key in entries:
+                if total <= target:
+                    break
+                for path in self._paths(key):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+            self.total_bytes = total
+            logging.debug(f"HTTP cache trimmed to {total} bytes")
+
+    def clear(self):
+        """Deletes every cached entry."""
+        with self.lock:
+            self.total_bytes = 0
+            for name in os.listdir(self.cache_dir):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+
+def get_cache():
+    """Returns the process-wide shared HTTP cache (created on first use)."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = HTTPCache()
+        return _shared_cache
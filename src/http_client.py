@@ -0,0 +1,99 @@
+import time
+import threading
+import requests
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import metrics
+from rate_limiter import get_throttle, parse_retry_after
+from config import USER_AGENT, HTTP_TIMEOUT, HTTP_POOL_SIZES, DEFAULT_HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_BACKOFF_FACTOR
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    def __init__(self, *args, timeout=HTTP_TIMEOUT, **kwargs):
+        """HTTPAdapter that applies a default timeout to every request that does not set one.
+
+        Every request also goes through its host's AIMD controller: it waits for a concurrency slot and its
+        outcome (status, latency, Retry-After, timeouts) tunes how hard the host is pushed.
+        """
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        throttle = get_throttle(urlparse(request.url).netloc)
+        throttle.acquire()
+        started = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.Timeout:
+            throttle.on_throttled("timeout")
+            raise
+        except requests.ConnectionError:
+            throttle.on_error()
+            raise
+        finally:
+            throttle.release()
+
+        # Statuses urllib3 already retried (and slept on) still tell us the host was overloaded
+        retries = getattr(response.raw, 'retries', None)
+        retried_statuses = [entry.status for entry in retries.history if entry.status] if retries else []
+        throttle.on_response(response.status_code, time.monotonic() - started,
+                             retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                             retried_statuses=retried_statuses)
+        return response
+
+
+def record_response(response, *args, **kwargs):
+    """Response hook counting HTTP status codes and urllib3 retries for the run report."""
+    metrics.inc("http_responses_total", status=response.status_code)
+    retries = getattr(response.raw, 'retries', None)
+    if retries is not None and retries.history:
+        metrics.inc("http_retries_total", len(retries.history))
+
+
+def build_retry():
+    """Retry policy for idempotent requests: connection errors and transient server errors."""
+    return Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,  # Hand the last response back so callers' raise_for_status() still works
+    )
+
+
+def create_session():
+    """Creates a requests.Session with pooled keep-alive connections, default timeouts, retries and our User-Agent."""
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    session.hooks['response'].append(record_response)
+
+    default_adapter = TimeoutHTTPAdapter(
+        pool_connections=DEFAULT_HTTP_POOL_SIZE,
+        pool_maxsize=DEFAULT_HTTP_POOL_SIZE,
+        max_retries=build_retry(),
+    )
+    session.mount("http://", default_adapter)
+    session.mount("https://", default_adapter)
+
+    # Hosts we hit many times per batch get their own, larger connection pool
+    for host, pool_size in HTTP_POOL_SIZES.items():
+        adapter = TimeoutHTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=build_retry())
+        session.mount(f"https://{host}/", adapter)
+        session.mount(f"http://{host}/", adapter)
+    return session
+
+
+def get_session():
+    """Returns the process-wide shared session (created on first use)."""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
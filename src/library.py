@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import closing
+from config import HASH_BLOCK_SIZE, MANIFEST_NAME, LIBRARY_DB, DEDUP_MODE
+
+FICLONE = 0x40049409  # Linux ioctl that makes a copy-on-write clone (btrfs, XFS, bcachefs)
+
+_shared_index = None
+_shared_index_lock = threading.Lock()
+_manifest_locks = {}
+_manifest_locks_lock = threading.Lock()
+
+
+class BlockHasher:
+    def __init__(self, blocks=None):
+        """Content hash built while the data is written: sha256 of every HASH_BLOCK_SIZE block.
+
+        Blocks are independent, so single-stream and segmented downloads produce the same digest, and a
+        resumed download only needs the digests of the blocks it already finished.
+        """
+        self.blocks = list(blocks or [])  # Hex digests of the completed blocks
+        self.current = hashlib.sha256()
+        self.filled = 0
+
+    @property
+    def hashed_bytes(self):
+        """Bytes covered by completed blocks; resuming from here keeps the hash exact."""
+        return len(self.blocks) * HASH_BLOCK_SIZE
+
+    def update(self, data):
+        data = memoryview(data)
+        while data:
+            take = min(len(data), HASH_BLOCK_SIZE - self.filled)
+            self.current.update(data[:take])
+            self.filled += take
+            data = data[take:]
+            if self.filled == HASH_BLOCK_SIZE:
+                self.blocks.append(self.current.hexdigest())
+                self.reset_partial()
+
+    def reset_partial(self):
+        """Drops the bytes hashed since the last complete block. Returns how many were dropped."""
+        dropped = self.filled
+        self.current = hashlib.sha256()
+        self.filled = 0
+        return dropped
+
+    def finish(self):
+        """Closes the trailing partial block and returns the block digests."""
+        if self.filled:
+            self.blocks.append(self.current.hexdigest())
+            self.reset_partial()
+        return self.blocks
+
+
+def combine_blocks(blocks):
+    """File digest from its block digests."""
+    return hashlib.sha256(b"".join(bytes.fromhex(block) for block in blocks)).hexdigest()
+
+
+def content_digest(path):
+    """Digest of a file already on disk (same scheme as downloads compute in-stream)."""
+    hasher = BlockHasher()
+    buffer = bytearray(HASH_BLOCK_SIZE)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as file:
+        while True:
+            count = file.readinto(buffer)
+            if not count:
+                break
+            hasher.update(view[:count])
+    return combine_blocks(hasher.finish())
+
+
+def _manifest_lock(directory):
+    with _manifest_locks_lock:
+        return _manifest_locks.setdefault(os.path.abspath(directory), threading.Lock())
+
+
+class Manifest:
+    def __init__(self, directory):
+        """Per-directory JSON record of every downloaded file: digest, size, source URL and server."""
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.lock = _manifest_lock(directory)
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+            return {}
+
+    def get(self, file_name):
+        return self.load().get(file_name)
+
+    def record(self, file_name, **entry):
+        """Adds or replaces the entry for `file_name` (written atomically, safe across worker threads)."""
+        with self.lock:
+            entries = self.load()
+            entries[file_name] = {**entry, "recorded_at": time.time()}
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(entries, file, indent=2, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+    def verify(self):
+        """Re-hashes every listed file. Returns {file_name: problem} for missing or corrupt files."""
+        problems = {}
+        for file_name, entry in sorted(self.load().items()):
+            path = os.path.join(self.directory, file_name)
+            if not os.path.exists(path):
+                problems[file_name] = "missing"
+            elif os.path.getsize(path) != entry.get("size"):
+                problems[file_name] = f"size {os.path.getsize(path)} != {entry.get('size')}"
+            elif content_digest(path) != entry.get("digest"):
+                problems[file_name] = "digest mismatch"
+        return problems
+
+
+class LibraryIndex:
+    def __init__(self, db_path=LIBRARY_DB):
+        """SQLite index of digest -> file path across every download directory, used to find duplicates."""
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    added_at REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS files_digest ON files (digest)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def add(self, path, digest, size):
+        with closing(self._connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO files (path, digest, size, added_at) VALUES (?, ?, ?, ?)",
+                               (os.path.abspath(path), digest, size, time.time()))
+
+    def find(self, digest, size, exclude=None):
+        """Returns an existing file with this digest and size, dropping entries whose file is gone or changed."""
+        exclude = os.path.abspath(exclude) if exclude else None
+        with closing(self._connect()) as connection:
+            paths = [row[0] for row in connection.execute(
+                "SELECT path FROM files WHERE digest = ? AND size = ?", (digest, size))]
+        stale = []
+        found = None
+        for path in paths:
+            if path == exclude:
+                continue
+            if os.path.isfile(path) and os.path.getsize(path) == size:
+                found = path
+                break
+            stale.append(path)
+        if stale:
+            with closing(self._connect()) as connection, connection:
+                connection.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in stale])
+        return found
+
+
+def _reflink(source, target):
+    import fcntl
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def link_file(source, target, mode=DEDUP_MODE):
+    """Makes `target` share `source`'s data (reflink, else hard link). Returns the method used or None.
+
+    The link is built next to `target` and swapped in, so `target` is never missing or half-written.
+    """
+    if mode == "off":
+        return None
+    methods = {"auto": ("reflink", "hardlink"), "reflink": ("reflink",), "hardlink": ("hardlink",)}[mode]
+    temp_path = f"{target}.link"
+    for method in methods:
+        try:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if method == "reflink":
+                _reflink(source, temp_path)
+            else:
+                os.link(source, temp_path)
+            os.replace(temp_path, target)
+            return method
+        except (OSError, ImportError):
+            # Different filesystem, no reflink support (or no fcntl on Windows), or links not allowed
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return None
+
+
+def get_library_index():
+    """Returns the process-wide library index (created on first use)."""
+    global _shared_index
+    with _shared_index_lock:
+        if _shared_index is None:
+            _shared_index = LibraryIndex()
+        return _shared_index
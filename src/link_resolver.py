@@ -0,0 +1,59 @@
+import logging
+import threading
+from metrics import metrics
+
+
+class ResolverStats:
+    def __init__(self):
+        """Per-server counters showing how often the plain-HTTP path avoids the browser."""
+        self.lock = threading.Lock()
+        self.servers = {}
+
+    def record(self, server, outcome):
+        """Increments the counter for `outcome` ('http_hit', 'http_miss', 'browser_hit' or 'browser_miss')."""
+        with self.lock:
+            counters = self.servers.setdefault(server or "unknown", {
+                "http_hit": 0, "http_miss": 0, "browser_hit": 0, "browser_miss": 0,
+            })
+            counters[outcome] += 1
+
+    def summary(self):
+        """Returns a copy of the counters, keyed by server name."""
+        with self.lock:
+            return {server: dict(counters) for server, counters in self.servers.items()}
+
+    def log_summary(self):
+        for server, counters in self.summary().items():
+            attempts = counters["http_hit"] + counters["http_miss"]
+            hit_rate = counters["http_hit"] / attempts * 100 if attempts else 0
+            logging.info(
+                f"Link resolution for {server}: {counters['http_hit']} via HTTP, "
+                f"{counters['http_miss']} fell back to browser ({hit_rate:.0f}% browser-free), "
+                f"{counters['browser_hit']} resolved by browser, {counters['browser_miss']} unresolved"
+            )
+
+
+class LinkResolver:
+    def __init__(self, url_fetcher, browser_resolver):
+        """Resolve links with a plain HTTP request first, using `browser_resolver(url)` only as a fallback."""
+        self.url_fetcher = url_fetcher
+        self.browser_resolver = browser_resolver
+        self.stats = ResolverStats()
+
+    def resolve(self, initial_url, server=None, allow_browser=True):
+        """Returns the final download URL for `initial_url`, or None if both paths fail."""
+        # Fast path: a single GET that finds #downloadButton without starting a browser
+        with metrics.timer("http_resolve_seconds", server=server or "unknown"):
+            final_url = self.url_fetcher.get_final_url(initial_url)
+        if final_url:
+            self.stats.record(server, "http_hit")
+            return final_url
+        self.stats.record(server, "http_miss")
+        if not allow_browser:
+            return None
+        logging.info(f"HTTP resolution failed for {initial_url}, falling back to Selenium.")
+
+        # Slow path: no button in the static HTML, bot detection, or the page needs JavaScript
+        final_url = self.browser_resolver(initial_url)
+        self.stats.record(server, "browser_hit" if final_url else "browser_miss")
+        return final_url
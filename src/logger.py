@@ -1,9 +1,120 @@
+import os
+import time
+import queue
+import atexit
 import logging
+import threading
+import logging.handlers
+from config import (
+    LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_REPEAT_LIMIT, LOG_REPEAT_WINDOW,
+    DEBUG_DUMPS, DEBUG_DUMP_DIR, DEBUG_DUMP_MAX_BYTES, DEBUG_DUMP_MAX_FILES,
+)
 
-def setup_logger():
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        filename='scraper_debug.log',
-        filemode='w'
-    )
+_listener = None
+_setup_lock = threading.Lock()
+_dump_lock = threading.Lock()
+_debug_dumps = DEBUG_DUMPS
+
+
+class RepeatFilter(logging.Filter):
+    def __init__(self, limit=LOG_REPEAT_LIMIT, window=LOG_REPEAT_WINDOW):
+        """Lets at most `limit` records from the same logging call through per `window` seconds.
+
+        Messages are f-strings, so repeats are recognised by their call site rather than their text. The
+        first record after a quiet spell notes how many were dropped.
+        """
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.sites = {}  # (pathname, lineno, levelno) -> [window_start, count, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno, record.levelno)
+        now = time.monotonic()
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site else 0
+                self.sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+                    record.args = None
+                return True
+            site[1] += 1
+            if site[1] <= self.limit:
+                return True
+            site[2] += 1
+            return False
+
+
+def setup_logger(level=LOG_LEVEL, log_file=LOG_FILE):
+    """Sends every log record through a queue to a background thread that writes the rotating log file.
+
+    Worker threads only pay for putting the record on the queue, so a burst of errors never blocks them
+    on disk writes. Safe to call more than once; only the first call configures logging.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True)
+        if os.path.exists(log_file) and os.path.getsize(log_file):
+            file_handler.doRollover()  # Each run starts a fresh file; earlier runs become the backups
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'))
+
+        queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(RepeatFilter())  # Dropped on the calling thread, before anything is formatted
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logger)
+
+
+def stop_logger():
+    """Writes out the queued records and stops the background writer."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+
+
+def set_debug_dumps(enabled):
+    """Turns the page source dumps of dump_debug() on or off (the --debug-dumps flag)."""
+    global _debug_dumps
+    _debug_dumps = enabled
+
+
+def dump_debug(name, content):
+    """Saves a large payload (e.g. page source) to DEBUG_DUMP_DIR when DEBUG_DUMPS is on. Returns the path or None.
+
+    `content` may be a callable so the payload is not even built while dumps are off. Each file is capped at
+    DEBUG_DUMP_MAX_BYTES and only the newest DEBUG_DUMP_MAX_FILES are kept.
+    """
+    if not _debug_dumps:
+        return None
+    try:
+        if callable(content):
+            content = content()
+        data = content.encode('utf-8', 'replace') if isinstance(content, str) else bytes(content)
+        os.makedirs(DEBUG_DUMP_DIR, exist_ok=True)
+        path = os.path.join(DEBUG_DUMP_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}-{name}.txt")
+        with open(path, 'wb') as file:
+            file.write(data[:DEBUG_DUMP_MAX_BYTES])
+        with _dump_lock:
+            dumps = sorted(os.path.join(DEBUG_DUMP_DIR, entry) for entry in os.listdir(DEBUG_DUMP_DIR))
+            for old in dumps[:-DEBUG_DUMP_MAX_FILES]:
+                os.remove(old)
+        return path
+    except Exception as e:
+        logging.warning(f"Could not write debug dump {name}: {e}")
+        return None
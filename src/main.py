@@ -1,13 +1,23 @@
-import re
+import os
+import sys
+import json
 import logging
+import argparse
+import requests
+from contextlib import contextmanager
 from session_manager import SessionManager
 from chapter_processor import ChapterProcessor
 from searcher import AnimeSearcher
-from logger import setup_logger
-from config import get_output_dir
+from logger import setup_logger, set_debug_dumps
+from config import get_output_dir, sanitize_filename
 from episode_fetcher import EpisodeFetcher
 from config import SERVER_PREFERENCES
 from config import XPATH
+from config import METRICS_JSON_PATH, METRICS_PROMETHEUS_PORT
+from config import STATUS_NAMES
+from config import BATCH_MAX_CONCURRENCY
+from metrics import metrics
+from catalog import CatalogIndex, CatalogSync
 # Import server preferences
 
 
@@ -15,18 +25,28 @@ class AnimeDownloader:
     def __init__(self):
         setup_logger()
         self.logger = logging.getLogger(__name__)
-        self.session_manager = SessionManager()
+        self.session_manager = SessionManager(credentials_callback=self.ask_credentials)
         self.searcher = AnimeSearcher()
+        self.catalog = CatalogIndex()
         self.session = None
 
     def sanitize_filename(self, filename):
         """Replace illegal characters with underscores for directory names."""
-        return re.sub(r'[<>:"/\\|?*]', '_', filename)
+        return sanitize_filename(filename)
 
-    def prompt_login(self):
+    def ask_credentials(self):
         username = input("Enter your username: ")
         password = input("Enter your password: ")
-        self.session = self.session_manager.create_session(username, password)
+        return username, password
+
+    def prompt_login(self):
+        # Saved cookies from an earlier run skip the browser login entirely
+        self.session = self.session_manager.restore_session()
+        if self.session:
+            print("Logged in with the saved session.")
+            return True
+        username, password = self.ask_credentials()
+        self.session = self.session_manager.create_session(username, password, interactive=True)
         if not self.session:
             print("Failed to create session. Check your credentials or network connection.")
             self.logger.error("Session creation failed.")
@@ -45,7 +65,7 @@ class AnimeDownloader:
 
             if choice == '1':
                 anime_name_input = input("Enter the anime name to search: ")
-                results = self.searcher.search_anime(anime_name=anime_name_input)
+                results = self.search(anime_name=anime_name_input)
             elif choice == '2':
                 results = self.search_with_filters()
             elif choice == '3':
@@ -65,21 +85,42 @@ class AnimeDownloader:
 
         genres = [genre.strip() for genre in genres_input.split(',')] if genres_input else None
         years = [year.strip() for year in years_input.split(',')] if years_input else None
-        valid_statuses = {"1": "Emisión", "2": "Finalizado", "3": "Proximamente", "4": "En Cuarentena"}
-        statuses = [status.strip() for status in statuses_input.split(',') if status.strip() in valid_statuses]
+        statuses = [status.strip() for status in statuses_input.split(',') if status.strip() in STATUS_NAMES]
 
         self.logger.info(f"Searching anime with filters: genres={genres}, years={years}, statuses={statuses}")
-        return self.searcher.search_anime(genres=genres, years=years, statuses=statuses)
+        return self.search(genres=genres, years=years, statuses=statuses)
+
+    def search(self, **criteria):
+        """Answers from the local catalog when it has been synced and has a match, otherwise searches the site."""
+        if self.catalog.count():
+            self.logger.info(f"Searching local catalog: {criteria}")
+            results = self.catalog.search(**criteria)
+            if results:
+                return results
+            # Titles added since the last sync are only known to the site
+            self.logger.info("No match in the local catalog, searching the site")
+        return self.searcher.iter_search(**criteria)
 
     def handle_results(self, results):
-        if results:
-            print("\nSearch Results:")
+        # Results stream in page by page, so print each one as soon as it arrives
+        shown = []
+        try:
             for idx, anime in enumerate(results, start=1):
+                if idx == 1:
+                    print("\nSearch Results:")
+                shown.append(anime)
                 print(f"{idx}. {anime['title']} - {anime.get('year', 'N/A')} - {anime.get('status', 'N/A')}")
                 print(f"   Link: {anime.get('link', 'N/A')}")
                 print(f"   Description: {anime.get('description', 'No description available.')}")
+        except requests.RequestException as e:
+            # The results shown so far are still valid; the rest could not be loaded
+            print(f"Search could not load more results: {e}")
+            self.logger.error(f"Search interrupted after {len(shown)} results: {e}")
+            if not shown:
+                return
 
-            choice = self.select_anime(results)
+        if shown:
+            choice = self.select_anime(shown)
             if choice is not None:
                 self.process_anime(choice)
         else:
@@ -117,14 +158,25 @@ class AnimeDownloader:
             "download_button_xpath": XPATH,  # Add your actual XPath here
             }
             if start_chapter is not None and end_chapter is not None:
-                chapter_processor = ChapterProcessor(self.session, anime_link, anime_name, config) #Here goes the config
-                chapter_processor.process_chapters(start_chapter, end_chapter, output_dir)
+                # Asked here, before the download threads start, so a re-login never prompts from a worker
+                if self.session_manager.credentials is None:
+                    print("Enter your credentials so the saved session can be renewed if it expires (leave empty to skip).")
+                    if not self.session_manager.collect_credentials():
+                        print("No credentials given: downloads stop if the saved session expires.")
+                with ChapterProcessor(self.session, anime_link, anime_name, config) as chapter_processor: #Here goes the config
+                    chapter_processor.process_chapters(start_chapter, end_chapter, output_dir)
 
                 self.logger.info(f"Processed chapters from {start_chapter} to {end_chapter} for {anime_name}.")
+                self.report_metrics()
         else:
             print("No episodes found for the selected anime.")
             self.logger.warning(f"No episodes found for {anime_name}.")
 
+    def report_metrics(self):
+        """Prints the per-stage timing summary and saves it as JSON."""
+        print("\n" + metrics.summary())
+        metrics.write_json(METRICS_JSON_PATH)
+
     def prompt_chapter_range(self):
         while True:
             try:
@@ -139,10 +191,171 @@ class AnimeDownloader:
                 print("Invalid input. Please enter numeric values for chapter numbers.")
                 self.logger.error("Invalid input for chapter numbers.")
 
+@contextmanager
+def exported_metrics():
+    """Serves /metrics during a command when METRICS_PROMETHEUS_PORT is set, then writes METRICS_JSON_PATH."""
+    server = None
+    if METRICS_PROMETHEUS_PORT:
+        try:
+            server = metrics.start_http_server(METRICS_PROMETHEUS_PORT)
+        except OSError as e:
+            # e.g. a second worker on the same host; the job itself should still run
+            logging.warning(f"Could not serve metrics on port {METRICS_PROMETHEUS_PORT}: {e}")
+    try:
+        yield
+    finally:
+        if server:
+            server.shutdown()
+        metrics.write_json(METRICS_JSON_PATH)
+
+
+def sync_catalog(full=False):
+    """Crawls the /animes listing into the local catalog used for offline searches."""
+    setup_logger()
+    print("Synchronizing the anime catalog...")
+    stats = CatalogSync().run(full=full)
+    print(f"Catalog synchronized: {stats['added_or_updated']} new or updated, {stats['total']} total "
+          f"({stats['pages']} pages in {stats['seconds']:.1f}s)")
+
+
+def run_batch(job_file, summary_path=None):
+    """Runs a job file without prompts and returns a cron-friendly exit code."""
+    from batch import BatchRunner, JobFileError, load_job_file, EXIT_BAD_INPUT
+    setup_logger()
+    try:
+        job_data = load_job_file(job_file)
+    except JobFileError as e:
+        print(f"Invalid job file: {e}", file=sys.stderr)
+        return EXIT_BAD_INPUT
+
+    runner = BatchRunner(job_data)
+    exit_code = runner.run()
+    print(runner.summary_text())
+    print("\n" + metrics.summary())
+    if summary_path:
+        with open(summary_path, 'w', encoding='utf-8') as file:
+            json.dump({**runner.summary(), "metrics": metrics.snapshot()}, file, indent=2)
+    return exit_code
+
+
+def queue_command(args):
+    """Adds a job file to the shared work queue, shows its progress, or resets failed episodes."""
+    from work_queue import WorkQueue
+    setup_logger()
+    work_queue = WorkQueue(args.db) if args.db else WorkQueue()
+    if args.queue_command == "add":
+        from batch import BatchRunner, JobFileError, load_job_file, EXIT_BAD_INPUT
+        try:
+            job_data = load_job_file(args.job_file)
+        except JobFileError as e:
+            print(f"Invalid job file: {e}", file=sys.stderr)
+            return EXIT_BAD_INPUT
+        return BatchRunner(job_data).enqueue(work_queue)
+    if args.queue_command == "retry":
+        print(f"{work_queue.retry_failed(args.slug)} failed episode(s) queued again")
+        return 0
+
+    for slug, states in work_queue.counts().items():
+        print(f"{slug}: " + ", ".join(f"{count} {state}" for state, count in sorted(states.items())))
+    for slug, episode, error in work_queue.failures():
+        print(f"FAILED  {slug} episode {episode}: {error}")
+    return 0
+
+
+def run_worker(db=None, concurrency=None, wait=False):
+    """Runs one worker on the shared work queue until it is drained."""
+    from work_queue import WorkQueue
+    from worker import QueueWorker
+    setup_logger()
+    worker = QueueWorker(WorkQueue(db) if db else WorkQueue(), concurrency=concurrency or BATCH_MAX_CONCURRENCY)
+    exit_code = worker.run(wait=wait)
+    print("\n" + metrics.summary())
+    return exit_code
+
+
+def set_bandwidth(limit=None):
+    """Shows or changes the download bandwidth limit; running downloads pick it up within seconds."""
+    from rate_limiter import parse_bandwidth, get_bandwidth_limiter
+    from config import BANDWIDTH_OVERRIDE_FILE
+    if limit == "auto":
+        if os.path.exists(BANDWIDTH_OVERRIDE_FILE):
+            os.remove(BANDWIDTH_OVERRIDE_FILE)
+    elif limit is not None:
+        try:
+            parse_bandwidth(limit)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        os.makedirs(os.path.dirname(BANDWIDTH_OVERRIDE_FILE), exist_ok=True)
+        with open(BANDWIDTH_OVERRIDE_FILE, 'w', encoding='utf-8') as file:
+            file.write(limit)
+    current = get_bandwidth_limiter().current_limit()
+    print(f"Download bandwidth: {current / 1024 / 1024:.2f} MiB/s" if current else "Download bandwidth: unlimited")
+    return 0
+
+
+def verify_directory(directory):
+    """Re-hashes every file listed in a download directory's manifest and reports missing or corrupt ones."""
+    from library import Manifest
+    problems = Manifest(directory).verify()
+    for file_name, problem in problems.items():
+        print(f"{file_name}: {problem}")
+    print(f"{len(problems)} problem(s) found in {directory}" if problems else f"All files in {directory} verified.")
+    return 1 if problems else 0
+
+
 def main():
-    downloader = AnimeDownloader()
-    if downloader.prompt_login():
-        downloader.search_anime()
+    parser = argparse.ArgumentParser(description="Search and download anime from AnimeFenix.")
+    parser.add_argument("--debug-dumps", action="store_true",
+                        help="Save page sources of failed resolutions to capped files for troubleshooting")
+    subparsers = parser.add_subparsers(dest="command")
+    sync_parser = subparsers.add_parser("sync-catalog", help="Build or refresh the local catalog for instant searches")
+    sync_parser.add_argument("--full", action="store_true", help="Re-crawl every listing page instead of only new ones")
+    batch_parser = subparsers.add_parser("batch", help="Download every series listed in a JSON/YAML job file")
+    batch_parser.add_argument("job_file", help="Job file listing titles or slugs, episode ranges and output roots")
+    batch_parser.add_argument("--summary", help="Also write the run summary as JSON to this path")
+    verify_parser = subparsers.add_parser("verify", help="Check downloaded files against their directory manifest")
+    verify_parser.add_argument("directory", help="Download directory containing a manifest")
+    bandwidth_parser = subparsers.add_parser("bandwidth", help="Show or change the download bandwidth limit")
+    bandwidth_parser.add_argument("limit", nargs="?",
+                                  help='e.g. 2M or 500K, "off" for unlimited, "auto" for the configured schedule')
+    queue_parser = subparsers.add_parser("queue", help="Manage the shared work queue used by worker processes")
+    queue_parser.add_argument("--db", help="Queue database (default: ANIMESCRAPER_QUEUE_DB or ~/.animescraper)")
+    queue_commands = queue_parser.add_subparsers(dest="queue_command", required=True)
+    queue_add_parser = queue_commands.add_parser("add", help="Add every episode of a JSON/YAML job file")
+    queue_add_parser.add_argument("job_file", help="Job file listing titles or slugs, episode ranges and output roots")
+    queue_commands.add_parser("status", help="Show job counts per series and state")
+    queue_retry_parser = queue_commands.add_parser("retry", help="Queue failed episodes again")
+    queue_retry_parser.add_argument("--slug", help="Only retry this series")
+    worker_parser = subparsers.add_parser("worker", help="Download jobs from the shared work queue")
+    worker_parser.add_argument("--db", help="Queue database (default: ANIMESCRAPER_QUEUE_DB or ~/.animescraper)")
+    worker_parser.add_argument("--concurrency", type=int, help="Episodes resolved at once by this worker")
+    worker_parser.add_argument("--wait", action="store_true", help="Keep polling for new jobs instead of exiting")
+    args = parser.parse_args()
+    if args.debug_dumps:
+        set_debug_dumps(True)
+
+    if args.command == "verify":
+        sys.exit(verify_directory(args.directory))
+    if args.command == "bandwidth":
+        sys.exit(set_bandwidth(args.limit))
+    if args.command == "queue":
+        sys.exit(queue_command(args))
+
+    setup_logger()
+    # Commands that download or crawl: exported while they run, saved when they end
+    with exported_metrics():
+        if args.command == "sync-catalog":
+            sync_catalog(full=args.full)
+            return
+        if args.command == "batch":
+            sys.exit(run_batch(args.job_file, args.summary))
+        if args.command == "worker":
+            sys.exit(run_worker(args.db, args.concurrency, args.wait))
+
+        downloader = AnimeDownloader()
+        if downloader.prompt_login():
+            downloader.search_anime()
 
 if __name__ == "__main__":
     main()
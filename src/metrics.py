@@ -0,0 +1,193 @@
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the histogram buckets; the last bucket catches everything slower
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, float("inf"))
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Cumulative-style timing histogram with count, sum, min and max."""
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given percentile (capped at the observed maximum)."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min or 0.0,
+            "max": self.max or 0.0,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): count
+                        for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class Metrics:
+    def __init__(self):
+        """Process-wide registry of counters and timing histograms, keyed by name and labels."""
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Adds `value` to a counter."""
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Records a duration in a histogram."""
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Times the enclosed block into the `name` histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    @staticmethod
+    def _label_text(labels):
+        return ",".join(f"{key}={value}" for key, value in labels)
+
+    def snapshot(self):
+        """Returns every counter and histogram as plain data."""
+        with self.lock:
+            return {
+                "started": self.started,
+                "elapsed_seconds": time.time() - self.started,
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                "histograms": [{"name": name, "labels": dict(labels), **histogram.to_dict()}
+                               for (name, labels), histogram in sorted(self.histograms.items())],
+            }
+
+    def summary(self):
+        """Human-readable end-of-run report."""
+        snapshot = self.snapshot()
+        lines = [f"Run metrics ({snapshot['elapsed_seconds']:.1f}s elapsed)"]
+        if snapshot["histograms"]:
+            lines.append(f"  {'timer':<42}{'count':>7}{'total s':>10}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}{'max s':>9}")
+            for entry in snapshot["histograms"]:
+                name = entry["name"] + (f"{{{self._label_text(entry['labels'].items())}}}" if entry["labels"] else "")
+                lines.append(f"  {name:<42}{entry['count']:>7}{entry['sum']:>10.2f}{entry['mean']:>9.3f}"
+                             f"{entry['p50']:>9.3f}{entry['p95']:>9.3f}{entry['max']:>9.3f}")
+        for entry in snapshot["counters"]:
+            name = entry["name"] + (f"{{{self._label_text(entry['labels'].items())}}}" if entry["labels"] else "")
+            lines.append(f"  {name:<42}{entry['value']:>17,.0f}")
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.snapshot(), file, indent=2)
+        logging.info(f"Run metrics written to {path}")
+
+    def prometheus_text(self):
+        """Renders the registry in the Prometheus text exposition format."""
+        def render_labels(labels, extra=None):
+            pairs = list(labels) + ([extra] if extra else [])
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            # One TYPE line per family, so Prometheus knows _bucket/_sum/_count belong to a histogram
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE animescraper_{name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                declare(name, "counter")
+                lines.append(f"animescraper_{name}{render_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                declare(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    lines.append(f"animescraper_{name}_bucket{render_labels(labels, ('le', le))} {cumulative}")
+                lines.append(f"animescraper_{name}_sum{render_labels(labels)} {histogram.total}")
+                lines.append(f"animescraper_{name}_count{render_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        """Serves /metrics in Prometheus format from a background thread."""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        logging.info(f"Prometheus metrics available at http://{host}:{port}/metrics")
+        return server
+
+
+metrics = Metrics()  # Shared registry used by every module
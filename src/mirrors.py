@@ -0,0 +1,49 @@
+import time
+import logging
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+from config import MIRROR_PROBE_BYTES
+
+
+class SlowTransferError(IOError):
+    """A transfer stayed below MIRROR_MIN_THROUGHPUT while another mirror was available."""
+
+
+def probe_mirror(session, url):
+    """Times a small Range request. Returns (ttfb_seconds, bytes_per_second), or None if the mirror failed."""
+    started = time.monotonic()
+    received = 0
+    try:
+        with session.get(url, stream=True, headers={'Range': f"bytes=0-{MIRROR_PROBE_BYTES - 1}"}) as response:
+            response.raise_for_status()
+            ttfb = time.monotonic() - started
+            # A server that ignores Range sends the whole file; stop reading after the probe size either way
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                received += len(chunk)
+                if received >= MIRROR_PROBE_BYTES:
+                    break
+    except requests.RequestException as e:
+        logging.info(f"Mirror probe failed for {url}: {e}")
+        return None
+    # Includes the time to first byte, so a nearby mirror beats a distant one with the same bandwidth
+    elapsed = max(time.monotonic() - started, 1e-6)
+    return ttfb, received / elapsed
+
+
+def rank_mirrors(session, mirrors):
+    """Probes the (server, url) candidates concurrently and returns them fastest first.
+
+    Mirrors whose probe failed are kept at the end, in their original order, as a last resort.
+    """
+    if len(mirrors) < 2:
+        return list(mirrors)
+    with ThreadPoolExecutor(max_workers=len(mirrors)) as executor:
+        results = list(executor.map(lambda mirror: probe_mirror(session, mirror[1]), mirrors))
+
+    for (server, url), result in zip(mirrors, results):
+        if result:
+            metrics.observe("mirror_ttfb_seconds", result[0], server=server or "unknown")
+            logging.info(f"Mirror {server}: first byte after {result[0]:.2f}s, {result[1] / 1e6:.2f} MB/s")
+    reachable = sorted((index for index, result in enumerate(results) if result), key=lambda index: -results[index][1])
+    return [mirrors[index] for index in reachable] + [mirror for mirror, result in zip(mirrors, results) if not result]
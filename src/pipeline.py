@@ -0,0 +1,85 @@
+import logging
+import queue
+import itertools
+import threading
+from config import DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE
+
+_STOP = object()  # Sentinel telling a worker to exit
+_LAST = float("inf")
+
+
+class DownloadPipeline:
+    def __init__(self, downloader, workers=DOWNLOAD_WORKERS, queue_size=DOWNLOAD_QUEUE_SIZE):
+        """Download workers fed through a bounded queue, so downloads start while links are still resolving.
+
+        Waiting downloads are taken by priority (flagged series first), then lowest episode number, so the
+        next episodes to watch finish first however the links happened to resolve.
+        """
+        self.downloader = downloader
+        self.workers = workers
+        self.queue = queue.PriorityQueue(maxsize=queue_size)  # Bounded: producers block when downloads fall behind
+        self.order = itertools.count()  # Tie-breaker: equal keys keep submission order
+        self.threads = []
+        self.results = []
+        self.failures = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"download-worker-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def submit(self, download_url, output_dir, anime_name, chapter=None, server=None, callback=None, mirrors=None,
+               priority=0):
+        """Queues a resolved URL for download. Blocks while the queue is full (backpressure).
+
+        `callback(result)` is called from the worker with the downloaded path, or None on failure.
+        `mirrors` lists every (server, url) serving the same episode, for probing and failover.
+        Higher `priority` downloads go first.
+        """
+        key = (-priority, chapter if chapter is not None else _LAST, next(self.order))
+        self.queue.put((key, (download_url, output_dir, anime_name, chapter, server, callback, mirrors)))
+        logging.debug(f"Queued chapter {chapter} for download ({self.queue.qsize()} waiting)")
+
+    def _worker(self):
+        while True:
+            _, item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                download_url, output_dir, anime_name, chapter, server, callback, mirrors = item
+                try:
+                    result = self.downloader.download_file(download_url, output_dir, anime_name, server=server,
+                                                           mirrors=mirrors)
+                except Exception as e:
+                    logging.error(f"Error downloading {download_url}: {e}")
+                    result = None
+                with self.lock:
+                    if result:
+                        self.results.append(result)
+                    else:
+                        self.failures.append(download_url)
+                if callback:
+                    try:
+                        callback(result)
+                    except Exception as e:
+                        logging.error(f"Download callback for {download_url} failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def close(self):
+        """Waits for every queued download to finish and stops the workers. Returns the downloaded paths."""
+        for _ in self.threads:
+            self.queue.put(((_LAST, _LAST, next(self.order)), _STOP))  # Sorted after every real download
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        return self.results
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,371 @@
+import re
+import threading
+import time
+import logging
+from datetime import datetime, time as day_time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from config import (
+    RATE_LIMITS, DEFAULT_RATE_LIMIT, AIMD_INITIAL_CONCURRENCY, AIMD_MIN_CONCURRENCY, AIMD_MAX_CONCURRENCY,
+    AIMD_MIN_RATE, AIMD_MAX_RATE, AIMD_RATE_STEP, AIMD_CONCURRENCY_STEP, AIMD_DECREASE_FACTOR, AIMD_WINDOW,
+    AIMD_MAX_ERROR_RATE, AIMD_SLOW_FACTOR, AIMD_BACKOFF_SECONDS, AIMD_MAX_BACKOFF_SECONDS, AIMD_DECREASE_COOLDOWN,
+    BANDWIDTH_LIMIT, BANDWIDTH_SCHEDULE, BANDWIDTH_OVERRIDE_FILE, BANDWIDTH_CHECK_SECONDS, BANDWIDTH_BURST_SECONDS,
+)
+from metrics import metrics
+
+THROTTLE_STATUSES = (429, 503)
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+_bandwidth = None
+_bandwidth_lock = threading.Lock()
+_UNSET = object()
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        """Initialize a bucket that refills `rate` tokens per second up to `burst` tokens."""
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)  # Start full so the first requests go out immediately
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.last_refill = now
+
+    def set_rate(self, rate):
+        """Changes the refill rate, keeping the tokens earned at the old rate."""
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` tokens are available and take them. Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                # Time until enough tokens have accumulated
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delay in seconds or an HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostThrottle:
+    def __init__(self, host, rate, burst, concurrency=AIMD_INITIAL_CONCURRENCY):
+        """AIMD controller for one host: request rate and concurrency grow additively while responses are
+        healthy and are cut multiplicatively on throttling signals."""
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.max_rate = max(AIMD_MAX_RATE, float(rate))
+        self.limit = float(concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.backoff = AIMD_BACKOFF_SECONDS
+        self.last_decrease = 0.0
+        self.window_successes = 0
+        self.window_errors = 0
+        self.latency = None  # Moving average of healthy response latency
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Blocks until the host is not paused and has a free concurrency slot."""
+        with self.condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    self.condition.wait(pause)
+                elif self.in_flight < max(AIMD_MIN_CONCURRENCY, int(self.limit)):
+                    self.in_flight += 1
+                    return
+                else:
+                    self.condition.wait()
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def wait_turn(self):
+        """Waits out any pause, then takes a token at the current rate. Returns the time spent waiting."""
+        pause = max(0.0, self.paused_until - time.monotonic())
+        if pause:
+            time.sleep(pause)
+        return pause + self.bucket.acquire()
+
+    def on_response(self, status, latency, retry_after=None, retried_statuses=()):
+        """Feeds one response into the controller."""
+        if status in THROTTLE_STATUSES or any(code in THROTTLE_STATUSES for code in retried_statuses):
+            self.on_throttled(f"http_{status if status in THROTTLE_STATUSES else 'retried'}",
+                              retry_after if status in THROTTLE_STATUSES else None)
+        elif status >= 500:
+            self.on_error()
+        else:
+            self.on_success(latency)
+
+    def on_success(self, latency):
+        with self.condition:
+            # A response much slower than usual is an early sign of overload, so it does not earn an increase
+            if self.latency is not None and latency > AIMD_SLOW_FACTOR * self.latency:
+                self.window_errors += 1
+            else:
+                self.window_successes += 1
+                self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+            self._evaluate_window()
+
+    def on_error(self):
+        with self.condition:
+            self.window_errors += 1
+            self._evaluate_window()
+
+    def on_throttled(self, reason, retry_after=None):
+        """Cuts rate and concurrency and pauses the host for Retry-After (or an exponential backoff)."""
+        with self.condition:
+            delay = retry_after if retry_after is not None else self.backoff
+            self.backoff = min(self.backoff * 2, AIMD_MAX_BACKOFF_SECONDS)
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self._decrease(reason)
+            logging.warning(f"{self.host} is throttling us ({reason}); pausing {delay:.1f}s, "
+                            f"now {self.bucket.rate:.2f} req/s with {int(self.limit)} in flight")
+            self.condition.notify_all()
+
+    def _evaluate_window(self):
+        total = self.window_successes + self.window_errors
+        if total < AIMD_WINDOW:
+            return
+        if self.window_errors / total > AIMD_MAX_ERROR_RATE:
+            self._decrease("errors")
+        else:
+            self._increase()
+        self.window_successes = self.window_errors = 0
+
+    def _increase(self):
+        self.limit = min(AIMD_MAX_CONCURRENCY, self.limit + AIMD_CONCURRENCY_STEP)
+        self.bucket.set_rate(min(self.max_rate, self.bucket.rate + AIMD_RATE_STEP))
+        self.backoff = AIMD_BACKOFF_SECONDS  # Healthy again, so the next pause starts short
+        metrics.inc("aimd_increases_total", host=self.host)
+        self.condition.notify_all()
+        logging.debug(f"{self.host}: raised to {self.bucket.rate:.2f} req/s with {int(self.limit)} in flight")
+
+    def _decrease(self, reason):
+        now = time.monotonic()
+        # Requests that were already in flight report the same overload; react to it only once
+        if now - self.last_decrease < AIMD_DECREASE_COOLDOWN:
+            return
+        self.last_decrease = now
+        self.limit = max(AIMD_MIN_CONCURRENCY, self.limit * AIMD_DECREASE_FACTOR)
+        self.bucket.set_rate(max(AIMD_MIN_RATE, self.bucket.rate * AIMD_DECREASE_FACTOR))
+        self.window_successes = self.window_errors = 0
+        metrics.inc("aimd_decreases_total", host=self.host, reason=reason)
+
+
+def get_throttle(host, limit=None):
+    """Returns the process-wide controller for a host, creating it from `limit` or config.RATE_LIMITS."""
+    with _throttles_lock:
+        throttle = _throttles.get(host)
+        if throttle is None:
+            throttle = _throttles[host] = _new_throttle(host, limit or RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT))
+        return throttle
+
+
+def configure_throttle(host, limit):
+    """Replaces a host's controller with one starting from the given limit."""
+    with _throttles_lock:
+        _throttles[host] = _new_throttle(host, limit)
+
+
+def _new_throttle(host, limit):
+    return HostThrottle(host, limit["rate"], limit["burst"], limit.get("concurrency", AIMD_INITIAL_CONCURRENCY))
+
+
+def report_blocked(url, reason):
+    """Reports a throttling signal that is not an HTTP status, e.g. a captcha or bot-detection page."""
+    get_throttle(urlparse(url).netloc).on_throttled(reason)
+
+
+class RateLimiter:
+    def __init__(self, limits=None, default=None):
+        """Paces requests per host through the shared AIMD controllers, seeded from config.RATE_LIMITS."""
+        self.limits = limits if limits is not None else RATE_LIMITS
+        self.default = default or DEFAULT_RATE_LIMIT
+        # Explicit limits (benchmarks, tests) restart the learned state for those hosts
+        if limits is not None:
+            for host, limit in limits.items():
+                configure_throttle(host, limit)
+
+    def get_throttle(self, host):
+        return get_throttle(host, self.limits.get(host, self.default))
+
+    def get_bucket(self, host):
+        """Return the token bucket for the given host, creating it on first use."""
+        return self.get_throttle(host).bucket
+
+    def wait(self, url):
+        """Block until a request to the URL's host is allowed."""
+        host = urlparse(url).netloc
+        waited = self.get_throttle(host).wait_turn()
+        metrics.observe("rate_limit_wait_seconds", waited, host=host)
+        if waited:
+            logging.debug(f"Rate limiter delayed request to {host} by {waited:.2f}s")
+        return waited
+
+
+def parse_bandwidth(text):
+    """Bytes per second from "2M", "500k", "1.5MB" or a plain number; None for "off", "none" or 0 (unlimited)."""
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return float(text) or None
+    value = str(text).strip().lower()
+    if value in ("", "off", "none", "unlimited"):
+        return None
+    match = re.fullmatch(r"([\d.]+)\s*([kmg]?)i?b?(?:/s)?", value)
+    if not match:
+        raise ValueError(f"Invalid bandwidth '{text}', expected e.g. 2M, 500K or off")
+    return float(match.group(1)) * 1024 ** " kmg".index(match.group(2) or " ") or None
+
+
+def _parse_clock(text):
+    """datetime.time from "HH:MM" ("8:00" and "08:00" alike); ValueError otherwise."""
+    match = re.fullmatch(r"(\d{1,2}):(\d{2})", str(text).strip())
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(f"Invalid schedule time '{text}', expected HH:MM")
+    return day_time(int(match.group(1)), int(match.group(2)))
+
+
+def parse_schedule(schedule):
+    """BANDWIDTH_SCHEDULE entries ("HH:MM", "HH:MM", limit) as (time, time, bytes per second); ValueError if malformed."""
+    parsed = []
+    for entry in schedule or ():
+        try:
+            start, end, limit = entry
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid schedule entry {entry!r}, expected (\"HH:MM\", \"HH:MM\", limit)") from None
+        parsed.append((_parse_clock(start), _parse_clock(end), parse_bandwidth(limit)))
+    return parsed
+
+
+def _scheduled_limit(schedule, default, now=None):
+    """Limit of the first parsed schedule entry covering the local time, else `default`."""
+    current = (now or datetime.now()).time().replace(second=0, microsecond=0)
+    for start, end, limit in schedule:
+        # A window whose end is before its start runs over midnight
+        if start <= current < end if start <= end else (current >= start or current < end):
+            return limit
+    return default
+
+
+class BandwidthLimiter:
+    def __init__(self, limit=BANDWIDTH_LIMIT, schedule=BANDWIDTH_SCHEDULE, override_path=BANDWIDTH_OVERRIDE_FILE):
+        """Caps the combined throughput of every download in the process.
+
+        The limit is, by priority: set_limit(), the override file (python main.py bandwidth 2M, read while
+        running), the time-of-day schedule, then the default. Bytes are paid for after they are read, so a
+        stream that ran ahead sleeps and TCP slows the sender down instead of the data being dropped.
+        """
+        self.default = parse_bandwidth(limit)
+        self.schedule = parse_schedule(schedule)  # Parsed once, so a bad entry fails at startup
+        self.override_path = override_path
+        self.manual = _UNSET
+        self.rate = None
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.next_check = 0.0
+        self.lock = threading.Lock()
+
+    def set_limit(self, limit):
+        """Overrides the limit for this process ("2M", bytes per second, or None for unlimited)."""
+        with self.lock:
+            self.manual = parse_bandwidth(limit)
+            self.next_check = 0.0
+
+    def reset_limit(self):
+        """Drops a set_limit() override and goes back to the override file and schedule."""
+        with self.lock:
+            self.manual = _UNSET
+            self.next_check = 0.0
+
+    def _read_override(self):
+        try:
+            with open(self.override_path, 'r', encoding='utf-8') as file:
+                return parse_bandwidth(file.read())
+        except FileNotFoundError:
+            return _UNSET
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring bandwidth override {self.override_path}: {e}")
+            return _UNSET
+
+    def _refresh(self, now):
+        """Re-evaluates the limit at most every BANDWIDTH_CHECK_SECONDS."""
+        if now < self.next_check:
+            return
+        self.next_check = now + BANDWIDTH_CHECK_SECONDS
+        limit = self.manual
+        if limit is _UNSET and self.override_path:
+            limit = self._read_override()
+        if limit is _UNSET:
+            limit = _scheduled_limit(self.schedule, self.default)
+        if limit != self.rate:
+            logging.info("Download bandwidth " + (f"limited to {limit / 1024 / 1024:.2f} MiB/s" if limit else "unlimited"))
+            self.rate = limit
+            self.tokens = min(self.tokens, self.capacity)
+            metrics.inc("bandwidth_limit_changes_total")
+
+    @property
+    def capacity(self):
+        return (self.rate or 0) * BANDWIDTH_BURST_SECONDS
+
+    def current_limit(self):
+        with self.lock:
+            self._refresh(time.monotonic())
+            return self.rate
+
+    def consume(self, count):
+        """Charges `count` bytes against the budget, sleeping if the downloads are ahead of it.
+
+        Returns the seconds slept. Callers may overdraw, which is paid back by sleeping, so reads of any
+        size work and concurrent streams are served in the order they asked.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refresh(now)
+            if not self.rate:
+                self.updated = now
+                return 0.0
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - count
+            self.updated = now
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+            metrics.inc("bandwidth_wait_seconds_total", delay)
+        return delay
+
+
+def get_bandwidth_limiter():
+    """Returns the process-wide download bandwidth limiter (created on first use)."""
+    global _bandwidth
+    with _bandwidth_lock:
+        if _bandwidth is None:
+            _bandwidth = BandwidthLimiter()
+        return _bandwidth
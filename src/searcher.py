@@ -1,11 +1,62 @@
 import requests
-from bs4 import BeautifulSoup
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from html_parser import make_soup, SEARCH_RESULTS_STRAINER
+from http_client import get_session
+from http_cache import get_cache
+from config import BASE_SEARCH_URL, SEARCH_MAX_PAGES, SEARCH_PREFETCH_PAGES
 
 class AnimeSearcher:
-    BASE_SEARCH_URL = "https://www3.animefenix.tv/animes"
+    BASE_SEARCH_URL = BASE_SEARCH_URL
 
-    def search_anime(self, anime_name=None, genres=None, years=None, types=None, statuses=None, order="default"):
+    def __init__(self, session=None, cache=None, base_search_url=None):
+        self.session = session or get_session()
+        self.cache = cache or get_cache()
+        if base_search_url:
+            self.BASE_SEARCH_URL = base_search_url
+
+    def search_anime(self, anime_name=None, genres=None, years=None, types=None, statuses=None, order="default",
+                     bypass_cache=False):
+        """Returns every result of the search, across all result pages."""
+        return list(self.iter_search(anime_name, genres, years, types, statuses, order, bypass_cache))
+
+    def iter_search(self, anime_name=None, genres=None, years=None, types=None, statuses=None, order="default",
+                    bypass_cache=False, max_pages=SEARCH_MAX_PAGES, prefetch=SEARCH_PREFETCH_PAGES):
+        """Yields search results page by page while the next pages are fetched in the background.
+
+        Stops at the first empty page (or one with no new results), and stops fetching as soon as the
+        caller stops consuming. Results are deduplicated by link. A page that cannot be fetched raises
+        requests.RequestException instead of ending the results early.
+        """
+        params = self.build_search_params(anime_name, genres, years, types, statuses, order)
+        seen_links = set()
+        pending = deque()  # Futures for the pages being prefetched, in page order
+        next_page = 1
+        executor = ThreadPoolExecutor(max_workers=prefetch)
+        try:
+            while True:
+                # Keep up to `prefetch` pages in flight ahead of the consumer
+                while len(pending) < prefetch and next_page <= max_pages:
+                    pending.append(executor.submit(self.fetch_search_page, params, next_page, bypass_cache))
+                    next_page += 1
+                if not pending:
+                    break
+
+                page_results = pending.popleft().result()
+                new_results = [anime for anime in page_results if anime["link"] not in seen_links]
+                if not new_results:
+                    break  # Past the last page
+
+                for anime in new_results:
+                    seen_links.add(anime["link"])
+                    yield anime
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def build_search_params(self, anime_name=None, genres=None, years=None, types=None, statuses=None, order="default"):
         params = {}
         # If an anime name is provided, search only by name
         if anime_name:
@@ -21,17 +72,35 @@ class AnimeSearcher:
             if statuses:
                 params['estado[]'] = statuses
             params['order'] = order
+        return params
+
+    def fetch_search_page(self, params, page, bypass_cache=False):
+        """Fetches and parses one page of search results. [] means the page really is empty.
+
+        Transient failures are already retried by the session's retry policy; what remains is raised.
+        """
+        page_params = dict(params, page=page) if page > 1 else params
+        results = None
+
+        def has_results(response):
+            # Only pages with anime cards are cached: a bot-check page (or the empty page past the end) is not
+            nonlocal results
+            results = self.parse_search_results(response.text)
+            return bool(results)
 
         try:
-            response = requests.get(self.BASE_SEARCH_URL, params=params)
+            response = self.cache.get(self.session, self.BASE_SEARCH_URL, params=page_params, endpoint="search",
+                                      bypass=bypass_cache, validate=has_results)
             response.raise_for_status()  # Raise an error for bad responses
-            return self.parse_search_results(response.text)
         except requests.RequestException as e:
-            logging.error(f"Error during anime search: {e}")
-            return []
+            logging.error(f"Error during anime search (page {page}): {e}")
+            raise
+        return results if results is not None else self.parse_search_results(response.text)
 
-    def parse_search_results(self, html):
-        soup = BeautifulSoup(html, 'html.parser')
+    @staticmethod
+    def parse_search_results(html):
+        """Extracts the anime cards from a listing page (static so worker processes can run it)."""
+        soup = make_soup(html, parse_only=SEARCH_RESULTS_STRAINER)
         anime_list = []
 
         # Loop through each anime card on the page, using a more general selector for cards
@@ -1,22 +1,39 @@
 # session_manager.py
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
-import logging
+import os
 import sys
+import json
 import time
-from webdriver_manager.chrome import ChromeDriverManager
-from config import LOGIN_URL
+import logging
+import threading
+import requests
+from requests.cookies import get_cookie_header
+from urllib.parse import urlparse, urljoin
+from config import LOGIN_URL, COOKIE_JAR_PATH, SESSION_CHECK_URL
+from http_client import get_session
+from browser import create_driver
+from metrics import metrics
+
+COOKIE_FIELDS = ("name", "value", "domain", "path", "expires", "secure")
+
 
 class SessionManager:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, cookie_path=COOKIE_JAR_PATH, credentials_callback=None):
+        """Logs in through Chrome once, then reuses the saved cookies and logs in again when they expire.
+
+        `credentials_callback` returns (username, password); collect_credentials() calls it on the main thread
+        so that re-logins from download threads never prompt.
+        """
+        self.session = get_session()  # Login cookies land in the session every module shares
         self.logger = logging.getLogger(__name__)
+        self.cookie_path = cookie_path
+        self.credentials = None
+        self.credentials_callback = credentials_callback
+        self.login_lock = threading.Lock()
+        self.local = threading.local()
+        # One expiry hook per shared session, however many managers are created
+        if not getattr(self.session, "relogin_hook_installed", False):
+            self.session.hooks['response'].append(self.expired_session_hook)
+            self.session.relogin_hook_installed = True
 
     def dynamic_log(self, message):
         sys.stdout.write(f"\r{message}")
@@ -24,34 +41,53 @@ class SessionManager:
 
     def is_captcha_present(self, driver):
         """Check if a CAPTCHA is present on the login page."""
+        from selenium.webdriver.common.by import By
+        from selenium.common.exceptions import NoSuchElementException
         try:
             driver.find_element(By.CLASS_NAME, "g-recaptcha")
             return True
         except NoSuchElementException:
             return False
 
-    def create_session(self, username, password):
-        """Create a session with the specified username and password."""
-        chrome_options = Options()
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--headless")  # Run headless if no GUI is needed
-        chrome_options.add_argument("--disable-gpu")
+    def open_login_form(self, driver, username, password):
+        """Loads the login page in `driver` and fills in the credentials."""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
 
-        # Use ChromeDriverManager to automatically manage the driver
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
+        driver.get(LOGIN_URL)
+        self.dynamic_log("Navigating to login page...")
 
-        try:
-            driver.get(LOGIN_URL)
-            self.dynamic_log("Navigating to login page...")
+        # Wait and fill the login form
+        WebDriverWait(driver, 2).until(EC.presence_of_element_located((By.ID, "username"))).send_keys(username)
+        WebDriverWait(driver, 2).until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password)
+
+    def create_session(self, username, password, interactive=False):
+        """Create a session with the specified username and password.
+
+        The login runs in a headless browser. If the page shows a CAPTCHA and `interactive` is set, it is
+        opened again in a visible window for the user to solve; otherwise the login fails.
+        """
+        # Selenium is imported here so runs that reuse saved cookies never load it
+        from selenium.webdriver.common.by import By
+        from selenium.common.exceptions import TimeoutException, WebDriverException
 
-            # Wait and fill the login form
-            WebDriverWait(driver, 2).until(EC.presence_of_element_located((By.ID, "username"))).send_keys(username)
-            WebDriverWait(driver, 2).until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password)
+        driver = create_driver(headless=True)
+
+        try:
+            self.open_login_form(driver, username, password)
 
             if self.is_captcha_present(driver):
+                if not interactive:
+                    self.logger.error("The login page shows a CAPTCHA; run main.py interactively once to solve it.")
+                    return None
+                # A headless browser cannot show the CAPTCHA, so the login page is reopened in a visible window
+                driver.quit()
+                driver = None
+                driver = create_driver(headless=False)
+                self.open_login_form(driver, username, password)
                 self.dynamic_log("CAPTCHA detected. Please solve the CAPTCHA in the browser and press Enter when done...")
-                print("Solving the CAPTCHA...")  # Wait for user to solve CAPTCHA
+                input()
 
             driver.find_element(By.ID, "send_button").click()
             self.logger.info("Clicked the login button.")
@@ -66,8 +102,12 @@ class SessionManager:
             # Set session cookies
             cookies = driver.get_cookies()
             for cookie in cookies:
-                self.session.cookies.set(cookie['name'], cookie['value'])
+                self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''),
+                                         path=cookie.get('path', '/'), expires=cookie.get('expiry'),
+                                         secure=cookie.get('secure', False))
             self.logger.info("Session cookies set successfully.")
+            self.credentials = (username, password)
+            self.save_cookies()
             return self.session
 
         except (TimeoutException, WebDriverException) as e:
@@ -76,5 +116,127 @@ class SessionManager:
             return None
 
         finally:
-            driver.quit()
+            if driver:
+                driver.quit()
             self.logger.info("WebDriver session closed.")
+
+    def login(self, username=None, password=None):
+        """Reuses the saved cookies when they are still valid, otherwise logs in with the given credentials."""
+        if username and password:
+            self.credentials = (username, password)
+        if self.restore_session():
+            return self.session
+        if not self.credentials:
+            return None
+        return self.create_session(*self.credentials)
+
+    def restore_session(self):
+        """Loads the saved cookie jar and checks it with one authenticated request."""
+        if not self.load_cookies():
+            return None
+        if self.is_session_valid():
+            self.logger.info("Reusing the saved login session.")
+            metrics.inc("session_restored_total")
+            return self.session
+        self.logger.info("Saved login session has expired.")
+        self.session.cookies.clear()
+        return None
+
+    def is_session_valid(self):
+        """A logged-in session gets the profile page; an expired one is redirected to the login page."""
+        self.local.checking = True
+        try:
+            response = self.session.get(SESSION_CHECK_URL, allow_redirects=False)
+        except requests.RequestException as e:
+            self.logger.warning(f"Could not validate the saved session: {e}")
+            return False
+        finally:
+            self.local.checking = False
+        return response.status_code == 200 and not self.is_login_redirect(response)
+
+    def save_cookies(self):
+        """Writes the cookie jar to disk, readable only by the current user."""
+        cookies = [{field: getattr(cookie, field) for field in COOKIE_FIELDS} for cookie in self.session.cookies]
+        os.makedirs(os.path.dirname(os.path.abspath(self.cookie_path)), exist_ok=True)
+        temp_path = f"{self.cookie_path}.tmp"
+        # Create the file with 0600 from the start so the cookies are never world-readable, even briefly
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(cookies, file)
+        os.chmod(temp_path, 0o600)
+        os.replace(temp_path, self.cookie_path)
+        self.logger.info(f"Saved {len(cookies)} session cookies to {self.cookie_path}")
+
+    def load_cookies(self):
+        """Loads saved cookies into the shared session. Returns False when there is nothing usable."""
+        try:
+            with open(self.cookie_path, 'r', encoding='utf-8') as file:
+                cookies = json.load(file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable cookie jar {self.cookie_path}: {e}")
+            return False
+
+        now = time.time()
+        loaded = 0
+        for cookie in cookies:
+            if cookie.get("expires") and cookie["expires"] < now:
+                continue
+            self.session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain", ""),
+                                     path=cookie.get("path", "/"), expires=cookie.get("expires"),
+                                     secure=cookie.get("secure", False))
+            loaded += 1
+        return loaded > 0
+
+    @staticmethod
+    def is_login_redirect(response):
+        if not response.is_redirect:
+            return False
+        location = urljoin(response.url, response.headers.get("Location", ""))
+        return urlparse(location).path == urlparse(LOGIN_URL).path
+
+    def collect_credentials(self):
+        """Asks `credentials_callback` for the login details if none are known yet. Call it before starting workers.
+
+        relogin() runs in the workers' response hooks while holding login_lock, so it never prompts itself.
+        Returns True when credentials are available.
+        """
+        if not self.credentials and self.credentials_callback:
+            username, password = self.credentials_callback()
+            if username and password:
+                self.credentials = (username, password)
+        return self.credentials is not None
+
+    def relogin(self, request):
+        """Logs in again after `request` was bounced to the login page. Threads that hit the expiry together share one login."""
+        probe = request.copy()
+        probe.headers.pop("Cookie", None)  # The cookie jar only fills in requests that have no Cookie header yet
+        with self.login_lock:
+            if request.headers.get("Cookie") != get_cookie_header(self.session.cookies, probe):
+                return True  # The cookies changed since the request was sent: another thread already logged in again
+            if not self.credentials:
+                self.logger.error("Session expired and no credentials are available to log in again.")
+                return False
+            self.logger.warning("Session expired, logging in again.")
+            metrics.inc("session_relogins_total")
+            self.session.cookies.clear()
+            return self.create_session(*self.credentials) is not None
+
+    def expired_session_hook(self, response, *args, **kwargs):
+        """Response hook: when a request is bounced to the login page, log in again and repeat it once."""
+        if getattr(self.local, "checking", False) or getattr(self.local, "retrying", False):
+            return None
+        if not self.is_login_redirect(response):
+            return None
+        if not self.relogin(response.request):
+            return None
+
+        request = response.request
+        headers = {key: value for key, value in request.headers.items() if key.lower() != "cookie"}
+        self.local.retrying = True
+        try:
+            return self.session.request(request.method, request.url, headers=headers, data=request.body,
+                                        timeout=kwargs.get("timeout"), stream=kwargs.get("stream", False))
+        finally:
+            self.local.retrying = False
@@ -0,0 +1,80 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from config import RESOLVED_URL_DB, RESOLVED_URL_TTL
+
+_shared_url_cache = None
+_shared_url_cache_lock = threading.Lock()
+
+
+class ResolvedURLCache:
+    def __init__(self, db_path=RESOLVED_URL_DB, ttl=RESOLVED_URL_TTL):
+        """SQLite store of final download URLs keyed by (anime slug, episode, server)."""
+        self.db_path = db_path
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS resolved_urls (
+                    slug TEXT NOT NULL,
+                    episode INTEGER NOT NULL,
+                    server TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    resolved_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (slug, episode, server)
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS resolved_urls_url ON resolved_urls (url)")
+
+    def _connect(self):
+        # One short-lived connection per call keeps this safe to use from worker threads
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, slug, episode, servers):
+        """Returns (server, url) for the first server in `servers` with an unexpired entry, or (None, None)."""
+        candidates = self.get_all(slug, episode, servers)
+        return candidates[0] if candidates else (None, None)
+
+    def get_all(self, slug, episode, servers):
+        """Returns every unexpired (server, url) for the episode, in the order of `servers`."""
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT server, url FROM resolved_urls WHERE slug = ? AND episode = ? AND expires_at > ?",
+                (slug, episode, time.time()),
+            ).fetchall()
+        urls = dict(rows)
+        return [(server, urls[server]) for server in servers if server in urls]
+
+    def put(self, slug, episode, server, url):
+        """Stores a freshly resolved URL."""
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO resolved_urls (slug, episode, server, url, resolved_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (slug, episode, server or "unknown", url, now, now + self.ttl),
+            )
+
+    def invalidate_url(self, url):
+        """Drops every entry pointing at `url` (e.g. after the mirror answered 403/404)."""
+        with closing(self._connect()) as connection, connection:
+            removed = connection.execute("DELETE FROM resolved_urls WHERE url = ?", (url,)).rowcount
+        if removed:
+            logging.info(f"Invalidated cached download URL: {url}")
+
+    def purge_expired(self):
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM resolved_urls WHERE expires_at <= ?", (time.time(),))
+
+
+def get_url_cache():
+    """Returns the process-wide resolved URL cache (created on first use)."""
+    global _shared_url_cache
+    with _shared_url_cache_lock:
+        if _shared_url_cache is None:
+            _shared_url_cache = ResolvedURLCache()
+        return _shared_url_cache
@@ -1,14 +1,18 @@
 import requests
-from bs4 import BeautifulSoup
 import logging
 import threading
-from selenium.webdriver.support import expected_conditions as EC
+from http_client import get_session
+from http_cache import get_cache
+from html_parser import make_soup, LazyStrainer
+from metrics import metrics
+from rate_limiter import report_blocked
 
 class URLFetcher:
     def __init__(self, config=None):
         self.session = None
-        self.lock = threading.Lock()  # Ensure thread-safe logging and resource access
-        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        self.rate_limiter = None
+        self.cache = get_cache()
+        self.lock = threading.Lock()  # Ensure thread-safe resource access; logging is set up once by logger.py
         self.config = config or {
             "download_button_id": "downloadButton",
             "link_class": "bg-orange-500",  # Adjust based on class used in the HTML
@@ -18,41 +22,60 @@ class URLFetcher:
     def set_session(self, session):
         self.session = session
 
+    def set_rate_limiter(self, rate_limiter):
+        """Throttle page requests through the given per-host RateLimiter."""
+        self.rate_limiter = rate_limiter
+
+    @staticmethod
+    def is_blocked_page(text):
+        """Bot-check and captcha pages are served with 200; they must not be parsed or cached as real pages."""
+        text = text.lower()
+        return "bot detection" in text or "captcha" in text
+
     def dynamic_log(self, message):
         """Log messages dynamically."""
         logging.info(message)
 
-    def get_page_content(self, url):
-        """Fetches the content of the specified URL using the session."""
+    def get_page_content(self, url, bypass_cache=False):
+        """Fetches the content of the specified URL using the session (served from the cache when fresh)."""
         try:
-            response = self.session.get(url) if self.session else requests.get(url)
-            response.raise_for_status()  # Raise an error for bad responses
+            with metrics.timer("page_fetch_seconds"):
+                # Only requests that actually reach the network wait on the per-host rate limiter
+                response = self.cache.get(self.session or get_session(), url, endpoint="download_page",
+                                          bypass=bypass_cache, rate_limiter=self.rate_limiter,
+                                          validate=lambda response: not self.is_blocked_page(response.text))
+            metrics.inc("page_fetches_total", source="cache" if getattr(response, "from_cache", False) else "network")
             return response.text
         except requests.RequestException as e:
             logging.error(f"Error fetching {url}: {e}")
+            metrics.inc("page_fetches_total", source="error")
             return None
 
     def get_final_url(self, start_url):
         """Get the final download URL from a given page."""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
             self.dynamic_log(f"Fetching URL: {start_url}")
-            response = self.session.get(start_url, headers=headers)
+            if self.rate_limiter:
+                self.rate_limiter.wait(start_url)
+            response = (self.session or get_session()).get(start_url)  # The shared session sets the User-Agent
             response.raise_for_status()
 
-            if "bot detection" in response.text.lower() or "captcha" in response.text.lower():
+            if self.is_blocked_page(response.text):
                 self.dynamic_log("Request blocked due to bot detection or CAPTCHA.")
+                report_blocked(start_url, "captcha")  # Slow down every request to this host, not just this one
                 return None
 
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = make_soup(response.content, parse_only=LazyStrainer('a', id=self.config["download_button_id"]))
 
             # Find the download link directly by ID
             try:
                 download_button = soup.find('a', id=self.config["download_button_id"])
                 if download_button and download_button['href']:
                     final_url = download_button['href']
+                    # A placeholder href (e.g. "javascript:" or "#") means the link is filled in by scripts
+                    if not final_url.startswith(("http://", "https://")):
+                        self.dynamic_log(f"Download button link requires JavaScript: {final_url}")
+                        return None
                     self.dynamic_log(f"Found final URL: {final_url}")
                     return final_url
                 else:
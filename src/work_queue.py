@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from contextlib import closing
+from config import (
+    WORK_QUEUE_DB, WORK_QUEUE_LEASE_SECONDS, WORK_QUEUE_MAX_ATTEMPTS, WORK_QUEUE_RETRY_DELAY, WORK_QUEUE_JOURNAL_MODE,
+)
+
+# Job states: claimed jobs are "resolving" until their link is queued for download, then "downloading"
+PENDING = "pending"
+RESOLVING = "resolving"
+DOWNLOADING = "downloading"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATES = (RESOLVING, DOWNLOADING)
+
+
+class Job:
+    def __init__(self, row):
+        """One (series, episode) row claimed from the queue."""
+        self.slug, self.episode, self.anime_name, self.output_dir, servers, self.priority, self.attempts = row
+        self.servers = json.loads(servers) if servers else None
+
+    def __repr__(self):
+        return f"<Job {self.slug} #{self.episode} attempt {self.attempts}>"
+
+
+class WorkQueue:
+    def __init__(self, db_path=WORK_QUEUE_DB, lease_seconds=WORK_QUEUE_LEASE_SECONDS,
+                 max_attempts=WORK_QUEUE_MAX_ATTEMPTS, retry_delay=WORK_QUEUE_RETRY_DELAY):
+        """Download backlog in a SQLite file, shared by any number of worker processes (on one or more hosts).
+
+        Workers claim jobs under a lease they keep alive with heartbeats. A job whose lease runs out (its
+        worker crashed or lost the share) is handed to the next worker that asks, so no work is lost or
+        done twice, and a restarted run continues exactly where the last one stopped.
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    slug TEXT NOT NULL,
+                    episode INTEGER NOT NULL,
+                    anime_name TEXT NOT NULL,
+                    output_dir TEXT NOT NULL,
+                    servers TEXT,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    result_path TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (slug, episode)
+                )
+            """)
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(jobs)")]
+            if "priority" not in columns:  # Queues created before priorities existed
+                connection.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, not_before)")
+
+    def _connect(self):
+        # Autocommit mode so claims can take the write lock up front with BEGIN IMMEDIATE
+        connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        connection.execute(f"PRAGMA journal_mode={WORK_QUEUE_JOURNAL_MODE}")
+        return connection
+
+    def _write(self, sql, parameters=()):
+        with closing(self._connect()) as connection:
+            return connection.execute(sql, parameters).rowcount
+
+    def enqueue(self, slug, anime_name, output_dir, episodes, servers=None, priority=0):
+        """Adds one pending job per episode. Episodes already in the queue are left as they are.
+
+        Returns how many jobs were added.
+        """
+        now = time.time()
+        rows = [(slug, int(episode), anime_name, output_dir, json.dumps(servers) if servers else None, priority,
+                 now, now)
+                for episode in episodes]
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO jobs (slug, episode, anime_name, output_dir, servers, priority, created_at, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            added = connection.total_changes - before
+            connection.execute("COMMIT")
+        return added
+
+    def claim(self, worker_id, limit=1):
+        """Leases up to `limit` jobs to `worker_id`: pending jobs that are due, then jobs whose lease expired.
+
+        Flagged (higher priority) series go first, then the lowest episode numbers across series.
+        """
+        now = time.time()
+        with closing(self._connect()) as connection:
+            # Taking the write lock before reading makes the select-then-update atomic across processes
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = connection.execute(
+                    "SELECT slug, episode, anime_name, output_dir, servers, priority, attempts, state FROM jobs "
+                    "WHERE (state = ? AND not_before <= ?) OR (state IN (?, ?) AND lease_expires < ?) "
+                    "ORDER BY priority DESC, episode, created_at, slug LIMIT ?",
+                    (PENDING, now, *ACTIVE_STATES, now, limit),
+                ).fetchall()
+                jobs = []
+                for *fields, attempts, state in rows:
+                    if state != PENDING:
+                        logging.warning(f"Lease on {fields[0]} episode {fields[1]} expired, reclaiming it")
+                    if attempts >= self.max_attempts:
+                        # A job that keeps killing its workers would otherwise be reclaimed forever
+                        connection.execute(
+                            "UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?, "
+                            "updated_at = ? WHERE slug = ? AND episode = ?",
+                            (FAILED, "lease expired on the last attempt", now, fields[0], fields[1]))
+                        continue
+                    connection.execute(
+                        "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, "
+                        "updated_at = ? WHERE slug = ? AND episode = ?",
+                        (RESOLVING, worker_id, now + self.lease_seconds, now, fields[0], fields[1]))
+                    jobs.append(Job((*fields, attempts + 1)))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return jobs
+
+    def heartbeat(self, worker_id):
+        """Extends every lease held by `worker_id`. Returns how many jobs it still holds."""
+        return self._write(
+            "UPDATE jobs SET lease_expires = ? WHERE lease_owner = ? AND state IN (?, ?)",
+            (time.time() + self.lease_seconds, worker_id, *ACTIVE_STATES))
+
+    def _transition(self, job, worker_id, state, **fields):
+        """Moves a job held by `worker_id` to `state`. Returns False if the lease was lost to another worker."""
+        assignments = "".join(f", {name} = ?" for name in fields)
+        changed = self._write(
+            f"UPDATE jobs SET state = ?, updated_at = ?{assignments} "
+            f"WHERE slug = ? AND episode = ? AND lease_owner = ? AND state IN (?, ?)",
+            (state, time.time(), *fields.values(), job.slug, job.episode, worker_id, *ACTIVE_STATES))
+        if not changed:
+            logging.warning(f"Lost the lease on {job.slug} episode {job.episode}; another worker owns it now")
+        return bool(changed)
+
+    def start_download(self, job, worker_id):
+        """Marks a resolved job as downloading (a no-op if its download already finished)."""
+        return bool(self._write(
+            "UPDATE jobs SET state = ?, updated_at = ? WHERE slug = ? AND episode = ? AND lease_owner = ? AND state = ?",
+            (DOWNLOADING, time.time(), job.slug, job.episode, worker_id, RESOLVING)))
+
+    def complete(self, job, worker_id, result_path):
+        return self._transition(job, worker_id, DONE, result_path=result_path, lease_owner=None,
+                                lease_expires=None, last_error=None)
+
+    def fail(self, job, worker_id, error):
+        """Puts the job back with exponential backoff, or marks it failed after max_attempts."""
+        if job.attempts >= self.max_attempts:
+            logging.error(f"{job.slug} episode {job.episode} failed {job.attempts} times: {error}")
+            return self._transition(job, worker_id, FAILED, last_error=error, lease_owner=None, lease_expires=None)
+        delay = self.retry_delay * 2 ** (job.attempts - 1)
+        return self._transition(job, worker_id, PENDING, last_error=error, lease_owner=None, lease_expires=None,
+                                not_before=time.time() + delay)
+
+    def release(self, worker_id):
+        """Returns every job held by `worker_id` to the queue without counting an attempt (clean shutdown)."""
+        return self._write(
+            "UPDATE jobs SET state = ?, attempts = MAX(attempts - 1, 0), lease_owner = NULL, lease_expires = NULL, "
+            "updated_at = ? WHERE lease_owner = ? AND state IN (?, ?)",
+            (PENDING, time.time(), worker_id, *ACTIVE_STATES))
+
+    def retry_failed(self, slug=None):
+        """Makes failed jobs pending again with a fresh attempt budget. Returns how many were reset."""
+        sql = "UPDATE jobs SET state = ?, attempts = 0, not_before = 0, updated_at = ? WHERE state = ?"
+        parameters = (PENDING, time.time(), FAILED)
+        if slug:
+            sql += " AND slug = ?"
+            parameters += (slug,)
+        return self._write(sql, parameters)
+
+    def unfinished(self):
+        """Number of jobs that are pending or held by a worker."""
+        with closing(self._connect()) as connection:
+            return connection.execute("SELECT COUNT(*) FROM jobs WHERE state IN (?, ?, ?)",
+                                      (PENDING, *ACTIVE_STATES)).fetchone()[0]
+
+    def counts(self):
+        """Returns {slug: {state: job_count}}."""
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT slug, state, COUNT(*) FROM jobs GROUP BY slug, state ORDER BY slug")
+            counts = {}
+            for slug, state, count in rows:
+                counts.setdefault(slug, {})[state] = count
+        return counts
+
+    def failures(self, slug=None):
+        """Returns [(slug, episode, last_error)] for failed jobs."""
+        sql = "SELECT slug, episode, last_error FROM jobs WHERE state = ?"
+        parameters = (FAILED,)
+        if slug:
+            sql += " AND slug = ?"
+            parameters += (slug,)
+        with closing(self._connect()) as connection:
+            return connection.execute(sql + " ORDER BY slug, episode", parameters).fetchall()
@@ -0,0 +1,154 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from chapter_processor import ChapterProcessor
+from downloader import Downloader
+from driver_pool import DriverPool
+from pipeline import DownloadPipeline
+from rate_limiter import RateLimiter
+from url_cache import get_url_cache
+from http_client import get_session
+from batch import login_from_environment, EXIT_OK, EXIT_PARTIAL_FAILURE, EXIT_BAD_INPUT
+from config import (
+    BASE_URL, SERVER_PREFERENCES, XPATH, BATCH_MAX_CONCURRENCY, DOWNLOAD_WORKERS, WORK_QUEUE_HEARTBEAT_SECONDS,
+    WORK_QUEUE_POLL_SECONDS,
+)
+
+
+class QueueWorker:
+    def __init__(self, work_queue, worker_id=None, concurrency=BATCH_MAX_CONCURRENCY, session=None):
+        """Pulls (series, episode) jobs from a shared WorkQueue, resolves and downloads them, and reports back.
+
+        At most `concurrency` episodes are resolved at once, plus one job per download worker waiting on
+        or in the download queue, so the worker never holds more leases than it can make progress on.
+        """
+        self.work_queue = work_queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency
+        self.session = session or get_session()
+        self.rate_limiter = RateLimiter()
+        self.url_cache = get_url_cache()
+        self.driver_pool = DriverPool()
+        self.pipeline = DownloadPipeline(Downloader(session=self.session, url_cache=self.url_cache))
+        self.slots = threading.BoundedSemaphore(concurrency + DOWNLOAD_WORKERS)
+        self.processors = {}
+        self.processors_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.done = 0
+        self.failed = 0
+        self.counts_lock = threading.Lock()
+        self.unrecorded = []  # (job, result_path, error) outcomes the queue could not store yet
+
+    def processor_for(self, job):
+        """One ChapterProcessor per series and server list, shared by its episodes."""
+        servers = job.servers or SERVER_PREFERENCES
+        key = (job.slug, tuple(servers))
+        with self.processors_lock:
+            if key not in self.processors:
+                config = {"server_preferences": servers, "download_button_xpath": XPATH, "priority": job.priority}
+                self.processors[key] = ChapterProcessor(
+                    self.session, f"{BASE_URL}/{job.slug}", job.anime_name, config, driver_pool=self.driver_pool,
+                    url_cache=self.url_cache, rate_limiter=self.rate_limiter)
+            return self.processors[key]
+
+    def _record(self, job, result_path, error):
+        if result_path:
+            self.work_queue.complete(job, self.worker_id, result_path)
+        else:
+            self.work_queue.fail(job, self.worker_id, error)
+
+    def _record_pending(self):
+        """Retries storing outcomes that failed earlier (called from the heartbeat thread)."""
+        with self.counts_lock:
+            pending, self.unrecorded = self.unrecorded, []
+        for index, outcome in enumerate(pending):
+            try:
+                self._record(*outcome)
+            except Exception as e:
+                logging.warning(f"Still cannot record the outcome of {outcome[0]}: {e}")
+                with self.counts_lock:
+                    self.unrecorded.extend(pending[index:])
+                return
+
+    def _finish(self, job, result_path=None, error=None):
+        try:
+            with self.counts_lock:
+                if result_path:
+                    self.done += 1
+                elif job.attempts >= self.work_queue.max_attempts:
+                    self.failed += 1  # Earlier attempts go back to the queue for a retry
+            self._record(job, result_path, error)
+        except Exception as e:
+            # e.g. "database is locked" on a shared drive: the heartbeat keeps the lease and retries the update
+            logging.error(f"Could not record the outcome of {job.slug} episode {job.episode}, will retry: {e}")
+            with self.counts_lock:
+                self.unrecorded.append((job, result_path, error))
+        finally:
+            self.slots.release()  # A lost slot would eventually stall the worker
+
+    def run_job(self, job):
+        """Resolves one episode and hands it to the download pipeline; the outcome is written to the queue."""
+        def on_downloaded(result):
+            self._finish(job, result_path=result, error=None if result else "download failed")
+
+        try:
+            os.makedirs(job.output_dir, exist_ok=True)
+            queued = self.processor_for(job).process_chapter(job.episode, job.output_dir, self.pipeline,
+                                                             on_downloaded=on_downloaded)
+        except Exception as e:
+            logging.error(f"Error processing {job.anime_name} episode {job.episode}: {e}")
+            return self._finish(job, error=str(e))
+        if not queued:
+            return self._finish(job, error="could not resolve a download link")
+        # Unless the download already finished (file present) and completed the job
+        self.work_queue.start_download(job, self.worker_id)
+
+    def _heartbeat(self):
+        while not self.stopped.wait(WORK_QUEUE_HEARTBEAT_SECONDS):
+            try:
+                self.work_queue.heartbeat(self.worker_id)
+            except Exception as e:
+                # A short outage of the shared database only matters if it outlasts the lease
+                logging.warning(f"Worker heartbeat failed: {e}")
+                continue
+            if self.unrecorded:
+                self._record_pending()
+
+    def run(self, wait=False):
+        """Processes jobs until the queue is drained (or forever with `wait`). Returns an exit code."""
+        if not login_from_environment():
+            logging.error("Worker: login failed, not taking any jobs.")
+            return EXIT_BAD_INPUT
+        logging.info(f"Worker {self.worker_id} started")
+        heartbeat = threading.Thread(target=self._heartbeat, name="queue-heartbeat", daemon=True)
+        heartbeat.start()
+        self.pipeline.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                while True:
+                    self.slots.acquire()
+                    jobs = self.work_queue.claim(self.worker_id)
+                    if jobs:
+                        executor.submit(self.run_job, jobs[0])
+                        continue
+                    self.slots.release()
+                    # Nothing due right now: stop once no job is left anywhere, otherwise wait for retries,
+                    # expired leases of crashed workers or newly added series
+                    if not wait and not self.work_queue.unfinished():
+                        break
+                    time.sleep(WORK_QUEUE_POLL_SECONDS)
+            self.pipeline.close()
+        except KeyboardInterrupt:
+            released = self.work_queue.release(self.worker_id)
+            logging.warning(f"Worker interrupted; returned {released} job(s) to the queue")
+            raise
+        finally:
+            self.stopped.set()
+            self.driver_pool.close()
+
+        logging.info(f"Worker {self.worker_id} finished: {self.done} done, {self.failed} failed")
+        return EXIT_PARTIAL_FAILURE if self.failed else EXIT_OK